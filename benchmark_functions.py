@@ -0,0 +1,64 @@
+"""
+Standard functions for testing optimizers. Each one scores a whole population at once:
+it takes a 2-dimensional array (population, dimensions) and returns a 1-dimensional
+array with one score per row. All of them have their minimum of 0 at a known point.
+"""
+
+import numpy as np
+
+
+def sphere(x):
+    """
+    The sum of squares. Minimum at 0
+    """
+
+    return np.einsum('ij,ij->i', x, x)
+
+
+def rastrigin(x):
+    """
+    A sphere covered in a grid of local minima. Minimum at 0
+    """
+
+    return 10 * x.shape[1] + np.sum(x ** 2 - 10 * np.cos(2 * np.pi * x), axis=1)
+
+
+def rosenbrock(x):
+    """
+    A long, curved, flat-bottomed valley. Minimum at 1
+    """
+
+    head = x[:, :-1]
+    tail = x[:, 1:]
+
+    return np.sum(100 * (tail - head ** 2) ** 2 + (1 - head) ** 2, axis=1)
+
+
+def ackley(x):
+    """
+    A nearly flat surface full of local minima, with one deep hole. Minimum at 0
+    """
+
+    spread = np.sqrt(np.mean(x ** 2, axis=1))
+    ripple = np.mean(np.cos(2 * np.pi * x), axis=1)
+
+    return -20 * np.exp(-.2 * spread) - np.exp(ripple) + 20 + np.e
+
+
+def griewank(x):
+    """
+    A bowl with ripples that get finer with the dimension. Minimum at 0
+    """
+
+    scales = np.sqrt(np.arange(1, x.shape[1] + 1))
+
+    return 1 + np.sum(x ** 2, axis=1) / 4000 - np.prod(np.cos(x / scales), axis=1)
+
+
+# each function, and how far out from 0 its usual search space goes in every dimension
+FUNCTIONS = {
+    'sphere': (sphere, 100),
+    'rastrigin': (rastrigin, 5.12),
+    'rosenbrock': (rosenbrock, 30),
+    'ackley': (ackley, 32.768),
+    'griewank': (griewank, 600)}
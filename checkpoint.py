@@ -0,0 +1,74 @@
+"""
+Saves and restores everything a trainer needs to carry on a run from the last
+generation it finished: the population or swarm, the fitness cache, the random number
+generators and the generation counter.
+"""
+
+import os
+import pickle
+import random
+import numpy as np
+
+CHECKPOINT_FNAME = "checkpoint.pkl"
+# how many generations to run between checkpoints by default
+CHECKPOINT_EVERY = 10
+
+
+def save(filename, state):
+    """
+    Writes a checkpoint. It's written to a temporary file and then renamed over the old
+    one, so a crash part way through leaves the old checkpoint as it was
+    :param filename: Where to write the checkpoint
+    :param state: A dict of whatever the trainer needs to carry on. The random number
+    generators' states are added to it
+    """
+
+    state = dict(state, np_random=np.random.get_state(), random=random.getstate())
+
+    temp_fname = filename + ".tmp"
+    with open(temp_fname, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temp_fname, filename)
+
+    # make sure the rename itself makes it to the disk
+    if hasattr(os, 'O_DIRECTORY'):
+        directory = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def load(filename):
+    """
+    Reads a checkpoint and puts the random number generators back the way they were
+    :param filename: The checkpoint's filename
+    :return: The dict that was saved
+    """
+
+    with open(filename, "rb") as f:
+        state = pickle.load(f)
+
+    np.random.set_state(state['np_random'])
+    random.setstate(state['random'])
+
+    return state
+
+
+def resume(filename=CHECKPOINT_FNAME):
+    """
+    Loads the checkpoint to resume a run from, if there is one
+    :return: The dict that was saved, or None if there's no checkpoint
+    """
+
+    if not os.path.exists(filename):
+        print("No checkpoint to resume from. Starting a new run")
+        return None
+
+    state = load(filename)
+    print("Resuming after generation " + str(state['iteration'] + 1))
+
+    return state
@@ -1,38 +1,291 @@
 import numpy as np
 import neuralnet
 import os.path
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
 
+# the most numbers to hold in memory for one layer of a population's outputs
+CHUNK_FLOATS = 2 ** 22
+# how much a mini-batch grows each generation by default
+BATCH_GROWTH = 1.1
+# how many rows siblings are raced on at a time
+RACE_ROWS = 512
+# how many rows of a csv to hold in memory at once when it's split up or parsed
+CHUNK_ROWS = 65536
+# the share of a data set that goes in the training set, and the seed that picks which rows do
+TRAINING_FRACTION = .7
+SPLIT_SEED = 0
 
-def make_te_tr_sets(filename: str):
+# data sets that have already been parsed, by filename
+dataset_cache = {}
+
+# in a worker process, the evaluators of the data sets in shared memory
+worker_evaluators = []
+worker_memory = []
+
+
+class Dataset:
+    """ A classification data set, parsed into numbers """
+
+    def __init__(self, data, targets, labels, name=''):
+        """
+        :param data: A 2-dimensional array of floats (N, num_inputs)
+        :param targets: A 1-dimensional array of ints. The index of each row's label
+        :param labels: The possible targets, in the order the outputs of a net stand for them
+        :param name: Where the data set came from
+        """
+        self.data = data
+        self.targets = targets
+        self.labels = labels
+        self.name = name
+
+    @classmethod
+    def from_csv(cls, csv, name=''):
+        """
+        Makes a data set from a 2-dimensional array of strings, with the targets in the last column
+        """
+
+        numcols = len(csv[0])
+        data = np.asarray(csv[:, :numcols - 1], dtype=float)  # the first columns are the data
+        labels, targets = np.unique(csv[:, numcols - 1], return_inverse=True)  # the last column is the targets
+
+        return cls(data, targets, labels, name)
+
+    def __len__(self):
+        return len(self.data)
+
+
+def load_dataset(filename: str):
+    """
+    Loads a data set, parsing the csv only if it hasn't been parsed since it last changed.
+    Parsed data sets are kept in memory and saved as .npy shards next to the csv. The data
+    and targets are memory mapped from the shards, so a set doesn't have to fit in memory
+    :param filename: The filename of the data
+    :return: The Dataset
+    """
+
+    stat = os.stat(filename)
+    key = os.path.abspath(filename)
+    stamp = np.array([stat.st_size, stat.st_mtime_ns])
+
+    cached = dataset_cache.get(key)
+    if cached is not None and np.array_equal(cached[0], stamp):
+        return cached[1]
+
+    cache_fnames = shard_fnames(filename)
+
+    if not all(os.path.isfile(x) for x in cache_fnames) or not np.array_equal(np.load(cache_fnames[0]), stamp):
+        # parse the csv a chunk at a time, straight into the shards
+        labels, num_columns, num_rows = scan_csv(filename)
+        shards = ShardWriter(filename, num_rows[0], num_columns, labels)
+        for (first_row, lines) in read_chunks(filename):
+            shards.write(*parse_chunk(lines, labels))
+        shards.close()
+
+    ds = Dataset(np.load(cache_fnames[1], mmap_mode='r'), np.load(cache_fnames[2], mmap_mode='r'),
+                 np.load(cache_fnames[3]), filename)
+
+    dataset_cache[key] = (stamp, ds)
+
+    return ds
+
+
+def shard_fnames(filename):
     """
-    Makes the testing and training sets from a larger data set
+    Gets the filenames of a csv's .npy shards: the stamp of the csv they were made from,
+    the data, the targets and the labels
+    """
+
+    return [filename + suffix for suffix in ('.stamp.npy', '.data.npy', '.targets.npy', '.labels.npy')]
+
+
+def read_chunks(filename, chunk_rows=CHUNK_ROWS):
+    """
+    Reads a csv a chunk of lines at a time. Blank lines are skipped
+    :return: A generator of (the number of the chunk's first row, a list of the chunk's lines)
+    """
+
+    first_row = 0
+    with open(filename) as file:
+        while True:
+            lines = [line.strip() for line in itertools.islice(file, chunk_rows)]
+            if not lines:
+                return
+
+            lines = [line for line in lines if line]
+            if lines:
+                yield first_row, lines
+                first_row += len(lines)
+
+
+def parse_chunk(lines, labels):
+    """
+    Parses a chunk of a csv's lines, with the targets in the last column
+    :param labels: Every label in the csv, sorted
+    :return: The data (rows, columns - 1), and the index of each row's label
+    """
+
+    csv = np.array([line.split(',') for line in lines], dtype=str)
+
+    return np.asarray(csv[:, :-1], dtype=float), np.searchsorted(labels, csv[:, -1])
+
+
+def scan_csv(filename, chunk_rows=CHUNK_ROWS, assign=None):
+    """
+    Reads through a csv a chunk at a time to find out how big its data set is, without
+    holding more than a chunk in memory
+    :param assign: A function (first row, number of rows) that gives back which set each
+    of those rows goes in, like split_rows. None to put them all in set 0
+    :return: The sorted labels, the number of columns, and how many rows go in each set
+    """
+
+    labels = set()
+    num_columns = 0
+    num_rows = np.zeros(2, dtype=int)
+
+    for (first_row, lines) in read_chunks(filename, chunk_rows):
+        num_columns = num_columns or len(lines[0].split(','))
+        labels.update(line.rsplit(',', 1)[-1] for line in lines)
+
+        sets = np.zeros(len(lines), dtype=int) if assign is None else assign(first_row, len(lines))
+        num_rows += np.bincount(sets, minlength=2)
+
+    return np.array(sorted(labels), dtype=str), num_columns, num_rows
+
+
+def split_rows(seed, first_row, count, training_fraction=TRAINING_FRACTION):
+    """
+    Picks which rows go in the training set by hashing their row numbers, so the same seed
+    always splits a file the same way, however it's read in chunks
+    :param seed: The seed of the hash
+    :param first_row: The number of the first row
+    :param count: How many rows
+    :param training_fraction: The chance of each row going in the training set
+    :return: 0 for each row that goes in the training set, and 1 for each one that goes in the testing set
+    """
+
+    # splitmix64 of the seeded row numbers. uint64 arrays wrap around rather than overflow
+    x = np.arange(first_row, first_row + count, dtype=np.uint64)
+    x += np.uint64((seed * 0x9e3779b97f4a7c15) % 2 ** 64)
+    x += np.uint64(0x9e3779b97f4a7c15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    x ^= x >> np.uint64(31)
+
+    # the top 53 bits as a float in [0, 1)
+    return ((x >> np.uint64(11)) * 2.0 ** -53 >= training_fraction).astype(int)
+
+
+class ShardWriter:
+    """
+    Writes a data set's .npy shards a chunk of rows at a time. The shards are the same
+    ones load_dataset saves, so it memory maps them rather than parsing the csv again.
+    Each shard is written under a temporary name and renamed into place when it's done,
+    so anything that has the old one memory mapped keeps it, and no one reads half a shard
+    """
+
+    def __init__(self, filename, num_rows, num_columns, labels):
+        """
+        :param filename: The csv the rows are from. The shards go next to it
+        :param num_rows: How many rows will be written
+        :param num_columns: How many columns the csv has, with the targets
+        :param labels: Every label in the data set, sorted
+        """
+
+        self.filename = filename
+        self.labels = labels
+        self.fnames = shard_fnames(filename)
+        self.temp_fnames = [x + "." + str(os.getpid()) + ".tmp" for x in self.fnames]
+        self.num_rows = int(num_rows)
+        self.rows = 0
+
+        # the rows are added to the ends of the files, so only a chunk is ever in memory
+        self.data = open(self.temp_fnames[1], "wb")
+        self.targets = open(self.temp_fnames[2], "wb")
+        np.lib.format.write_array_header_1_0(self.data, {'descr': '<f8', 'fortran_order': False,
+                                                         'shape': (self.num_rows, int(num_columns) - 1)})
+        np.lib.format.write_array_header_1_0(self.targets, {'descr': '<i8', 'fortran_order': False,
+                                                            'shape': (self.num_rows,)})
+
+    def write(self, data, targets):
+        """
+        Adds rows after the ones already written
+        """
+
+        np.ascontiguousarray(data, dtype='<f8').tofile(self.data)
+        np.ascontiguousarray(targets, dtype='<i8').tofile(self.targets)
+        self.rows += len(data)
+
+    def close(self):
+        """
+        Finishes the shards. The csv has to be finished first, since the shards are
+        stamped with its size and when it was changed
+        """
+
+        assert self.rows == self.num_rows
+
+        self.data.close()
+        self.targets.close()
+
+        with open(self.temp_fnames[3], "wb") as f:
+            np.save(f, self.labels)
+
+        stat = os.stat(self.filename)
+        with open(self.temp_fnames[0], "wb") as f:
+            np.save(f, np.array([stat.st_size, stat.st_mtime_ns]))
+
+        # the stamp goes last, so shards that weren't finished are never used
+        for i in (1, 2, 3, 0):
+            os.replace(self.temp_fnames[i], self.fnames[i])
+
+
+def make_te_tr_sets(filename: str, seed=SPLIT_SEED, chunk_rows=CHUNK_ROWS):
+    """
+    Makes the training and testing sets from a larger data set. The data set is streamed
+    a chunk of rows at a time, so it doesn't have to fit in memory. Each row is put in a
+    set by a seeded hash of its row number (see split_rows), so about TRAINING_FRACTION
+    of the rows are for training, and the same seed always gives the same sets. Each set
+    gets a csv and .npy shards that load_dataset memory maps
     :param filename: The filename of the data set to be used
+    :param seed: The seed of the split
+    :param chunk_rows: How many rows to hold in memory at once
     :return: Two filenames. (training filename, testing filename)
     """
-    
+
     training_fname = filename + '.tr'
     testing_fname = filename + '.te'
 
     # don't make the files if they already exist
     if os.path.isfile(training_fname) and os.path.isfile(testing_fname):
-        return testing_fname, training_fname
+        return training_fname, testing_fname
+
+    def assign(first_row, count):
+        return split_rows(seed, first_row, count)
+
+    # read through once to find out how big each set is, then again to write them
+    labels, num_columns, num_rows = scan_csv(filename, chunk_rows, assign)
+
+    fnames = (training_fname, testing_fname)
+    shards = [ShardWriter(fnames[i], num_rows[i], num_columns, labels) for i in range(0, 2)]
 
-    # get the data and shuffle it up
-    csv = np.genfromtxt(filename, delimiter=',', dtype=str)
-    np.random.shuffle(csv)
+    with open(training_fname, "w") as training_file, open(testing_fname, "w") as testing_file:
+        files = (training_file, testing_file)
 
-    # split it into training and testing
-    tr_size = int(.7 * len(csv))
-    te_size = len(csv) - tr_size
-    tr_data = csv[:tr_size]
-    te_data = csv[tr_size:tr_size + te_size]
+        for (first_row, lines) in read_chunks(filename, chunk_rows):
+            sets = assign(first_row, len(lines))
+            data, targets = parse_chunk(lines, labels)
 
-    # save them out
-    np.savetxt(training_fname, tr_data, delimiter=',', fmt='%s')
-    np.savetxt(testing_fname, te_data, delimiter=',', fmt='%s')
+            for i in range(0, 2):
+                rows = np.flatnonzero(sets == i)
+                files[i].write("".join(lines[row] + "\n" for row in rows))
+                shards[i].write(data[rows], targets[rows])
+
+    for shard in shards:
+        shard.close()
 
     # return the filenames
-    return testing_fname, training_fname
+    return training_fname, testing_fname
 
 
 def get_fitness_file(filename: str, net: neuralnet.FFNN):
@@ -43,28 +296,385 @@ def get_fitness_file(filename: str, net: neuralnet.FFNN):
     :return: The fitness score. 0 <= fitness <= 1
     """
 
-    csv = np.genfromtxt(filename, delimiter=",", dtype=str)
+    return get_fitness_ds(load_dataset(filename), net)
 
-    return get_fitness_ds(csv, net)
 
+def get_fitness_ds(ds, net: neuralnet.FFNN, rows=None):
+    """
+    Get the fitness of a neural net for classification
+    :param ds: The Dataset. A 2-dimensional array of strings, with the targets in the
+    last column, works too
+    :param net: The neural net object
+    :param rows: Only score on these rows, like the ones from stratified_rows. None for all of them
+    :return: The fitness score. 0 <= fitness <= 1
+    """
 
-def get_fitness_ds(csv, net: neuralnet.FFNN):
-    numcols = len(csv[0])
-    data = csv[:, :numcols - 1]  # the first columns are the data
-    targets = csv[:, numcols - 1]  # the last column is the targets
+    if not isinstance(ds, Dataset):
+        ds = Dataset.from_csv(ds)
 
-    # pull all the duplicates from the targets list
-    target_set = set(targets)
-    possible_targets = list(target_set)
+    data = ds.data if rows is None else ds.data[rows]
+    targets = ds.targets if rows is None else ds.targets[rows]
 
-    # now run through and test the accuracy
-    num_right = 0
+    # now run the whole set through the net at once and test the accuracy
+    outputs = net.get_outputs_batch(data)
+    num_right = np.count_nonzero(np.argmax(outputs, axis=1) == targets)
 
-    for (row, target) in zip(data, targets):
-        outputs = net.get_outputs(row)
+    # the fitness is the percentage correctly identified
+    return num_right / len(targets)
 
-        if np.argmax(outputs) == possible_targets.index(target):
-            num_right += 1
 
-    # the fitness is the percentage correctly identified
-    return num_right / len(data)
\ No newline at end of file
+def stratified_rows(targets, size, order=None, counts=None):
+    """
+    Picks a random subset of a data set's rows, with each label making up the same share of
+    it as of the whole set
+    :param targets: The targets of every row
+    :param size: How many rows to pick
+    :param order: The rows sorted by target, np.argsort(targets, kind='stable'). Pass it in
+    to not sort a big set every time
+    :param counts: How many rows each target has, np.bincount(targets)
+    :return: The picked rows, in order
+    """
+
+    if order is None:
+        order = np.argsort(targets, kind='stable')
+    if counts is None:
+        counts = np.bincount(targets)
+
+    size = min(size, len(targets))
+
+    # each label gets its share, and the rows left over from rounding down go to the
+    # labels that lost the most
+    shares = size * counts / len(targets)
+    quotas = np.floor(shares).astype(int)
+    extra = size - quotas.sum()
+    quotas[np.argsort(quotas - shares, kind='stable')[:extra]] += 1
+
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rows = [order[start + np.random.choice(count, quota, replace=False)]
+            for (start, count, quota) in zip(starts, counts, quotas) if quota > 0]
+
+    return np.sort(np.concatenate(rows)) if rows else np.zeros(0, dtype=int)
+
+
+class PopulationEvaluator:
+    """ Scores a whole population of same-topology neural nets on one data set """
+
+    def __init__(self, ds):
+        """
+        :param ds: The Dataset. A 2-dimensional array of strings, with the targets in the
+        last column, works too
+        """
+
+        if not isinstance(ds, Dataset):
+            ds = Dataset.from_csv(ds)
+
+        self.ds = ds
+        self.data = ds.data
+        self.targets = ds.targets
+        # the data in each precision genomes have come in, so float32 genomes run in float32
+        self.typed_data = {}
+
+    def data_as(self, dtype):
+        """
+        Gets the data in a precision. It's only converted the first time
+        :param dtype: np.float64 or np.float32
+        """
+
+        dtype = np.dtype(dtype)
+        if dtype not in self.typed_data:
+            self.typed_data[dtype] = self.data.astype(dtype, copy=False)
+
+        return self.typed_data[dtype]
+
+    def get_fitness(self, nets):
+        """
+        Get the fitness of every net in a population for classification
+        :param nets: A list of neural net objects. They must all have the same topology
+        :return: A 1-dimensional array of fitness scores. 0 <= fitness <= 1
+        """
+
+        if len(nets) == 0:
+            return np.zeros(0)
+
+        net = nets[0]
+        weights = np.stack([x.weights for x in nets])
+
+        return self.get_fitness_genomes(weights, net.topology, net.num_inputs, net.num_outputs)
+
+    def get_fitness_genomes(self, genomes, topology, num_inputs, num_outputs):
+        """
+        Get the fitness of every net in a population for classification
+        :param genomes: A 2-dimensional array of weights (nets, n_weights)
+        :return: A 1-dimensional array of fitness scores. 0 <= fitness <= 1
+        """
+
+        if len(genomes) == 0:
+            return np.zeros(0)
+
+        layers = neuralnet.split_layers(genomes, topology, num_inputs, num_outputs)
+
+        # run the rows through in chunks so the outputs of the widest layer fit in memory
+        widest = max(layer.shape[1] for layer in layers)
+        chunk_size = max(1, CHUNK_FLOATS // (len(genomes) * widest))
+
+        num_right = np.zeros(len(genomes), dtype=int)
+        data = self.data_as(neuralnet.weights_dtype(genomes))
+
+        for start in range(0, len(data), chunk_size):
+            outputs = neuralnet.get_outputs_population(layers, data[start:start + chunk_size])
+            guesses = np.argmax(outputs, axis=2)
+            num_right += np.count_nonzero(guesses == self.targets[start:start + chunk_size], axis=1)
+
+        # the fitness is the percentage correctly identified
+        return num_right / len(self.data)
+
+    def race_pairs(self, genomes, topology, num_inputs, num_outputs, known=None, chunk_rows=RACE_ROWS):
+        """
+        Finds the fitter of each pair of genomes (rows 2i and 2i+1) without always scoring both
+        on every row. The pairs are scored a chunk of rows at a time, and a genome stops being
+        scored as soon as it can't beat its sibling even if it gets every row left right. Ties
+        go to the second of the pair, so the winners are the same as with get_fitness_genomes
+        :param genomes: A 2-dimensional array of weights (2 * pairs, n_weights)
+        :param known: Fitness scores that are already known, like ones from a cache. nan
+        where they aren't known
+        :param chunk_rows: How many rows to score between checks
+        :return: The row of each pair's winner, and the winners' fitness
+        """
+
+        size = len(self.data)
+        num_genomes = len(genomes)
+
+        if known is None:
+            known = np.full(num_genomes, np.nan)
+        known = np.asarray(known, dtype=float)
+
+        # how many rows each genome has right, and whether it's still being scored
+        num_right = np.where(np.isnan(known), 0, np.rint(np.nan_to_num(known) * size)).astype(int)
+        scoring = np.isnan(known)
+        lost = np.zeros(num_genomes, dtype=bool)
+
+        widest = max(layer_shape[0] for layer_shape in neuralnet.layer_shapes(topology, num_inputs, num_outputs))
+        data = self.data_as(neuralnet.weights_dtype(genomes))
+
+        first = np.arange(0, num_genomes, 2)
+        second = first + 1
+
+        # the pairs are compared before any rows are scored too, so pairs whose scores
+        # were all known still get a winner
+        start = 0
+        while True:
+            # the most each genome could end up with
+            best_case = num_right + np.where(scoring, size - start, 0)
+
+            # the first of a pair only wins if it ends up strictly ahead
+            lost[first] |= best_case[first] <= num_right[second]
+            lost[second] |= best_case[second] < num_right[first]
+            scoring &= ~lost
+
+            if not np.any(scoring) or start >= size:
+                break
+
+            rows = scoring.nonzero()[0]
+            chunk_size = max(1, min(chunk_rows, CHUNK_FLOATS // (len(rows) * widest)))
+            end = min(size, start + chunk_size)
+
+            layers = neuralnet.split_layers(genomes[rows], topology, num_inputs, num_outputs)
+            outputs = neuralnet.get_outputs_population(layers, data[start:end])
+            num_right[rows] += np.count_nonzero(np.argmax(outputs, axis=2) == self.targets[start:end], axis=1)
+            start = end
+
+        winners = np.arange(0, num_genomes, 2) + lost[0::2]
+
+        return winners, num_right[winners] / size
+
+
+class MiniBatchEvaluator:
+    """
+    Scores populations on a stratified random subset of a data set's rows, like a
+    PopulationEvaluator. A new subset is picked every generation, so no one subset is
+    overfit, and it grows over the run until it's the whole set
+    """
+
+    def __init__(self, ds, size, growth=BATCH_GROWTH, adaptive=False):
+        """
+        :param ds: The Dataset
+        :param size: How many rows the first subset has
+        :param growth: How much bigger each subset is than the last
+        :param adaptive: If True, the subset only grows when the population's fitness is
+        spread out less than the subset's sampling noise, so it can't tell them apart
+        """
+
+        if not isinstance(ds, Dataset):
+            ds = Dataset.from_csv(ds)
+
+        self.full = ds
+        self.size = min(size, len(ds))
+        self.growth = growth
+        self.adaptive = adaptive
+        self.samples = 0
+
+        # sort the rows by label once, so picking subsets doesn't have to
+        self.order = np.argsort(ds.targets, kind='stable')
+        self.counts = np.bincount(ds.targets, minlength=len(ds.labels))
+
+        self.pick()
+
+    def complete(self):
+        """
+        Whether the subset is the whole set
+        """
+
+        return self.size >= len(self.full)
+
+    def resample(self, fitness=None):
+        """
+        Grows the subset and picks a new one. Call it once a generation
+        :param fitness: The population's fitness on the last subset, for adaptive
+        """
+
+        grow = True
+        if self.adaptive and fitness is not None and len(fitness) > 1:
+            # the standard error of an accuracy measured on this many rows
+            mean = np.clip(np.mean(fitness), .5 / self.size, 1 - .5 / self.size)
+            grow = np.std(fitness) < np.sqrt(mean * (1 - mean) / self.size)
+
+        if grow:
+            self.size = min(len(self.full), int(np.ceil(self.size * self.growth)))
+
+        self.pick()
+
+    def pick(self):
+        """
+        Picks the subset. Each subset has its own name, so scores on different subsets are
+        never mixed up in a cache. The whole set keeps the set's name
+        """
+
+        if self.complete():
+            self.ds = self.full
+        else:
+            self.samples += 1
+            rows = stratified_rows(self.full.targets, self.size, self.order, self.counts)
+            self.ds = Dataset(self.full.data[rows], self.full.targets[rows], self.full.labels,
+                              self.full.name + "#" + str(self.samples))
+
+        self.evaluator = PopulationEvaluator(self.ds)
+
+    def get_fitness_genomes(self, genomes, topology, num_inputs, num_outputs):
+        """
+        Get the fitness of every net in a population on the current subset
+        :param genomes: A 2-dimensional array of weights (nets, n_weights)
+        :return: A 1-dimensional array of fitness scores. 0 <= fitness <= 1
+        """
+
+        return self.evaluator.get_fitness_genomes(genomes, topology, num_inputs, num_outputs)
+
+    def race_pairs(self, genomes, topology, num_inputs, num_outputs, known=None, chunk_rows=RACE_ROWS):
+        """
+        Finds the fitter of each pair of genomes on the current subset. See PopulationEvaluator.race_pairs
+        """
+
+        return self.evaluator.race_pairs(genomes, topology, num_inputs, num_outputs, known, chunk_rows)
+
+
+class EvaluationPool:
+    """
+    A pool of worker processes that score populations on data sets. The data sets are put
+    in shared memory once, and genomes are sent to the workers as raw float buffers of
+    their own precision
+    """
+
+    def __init__(self, datasets, workers):
+        """
+        :param datasets: A list of Datasets. Use evaluator(i) to score on the ith one
+        :param workers: The number of worker processes
+        """
+
+        self.datasets = datasets
+        self.workers = workers
+        self.memory = []
+
+        specs = []
+        for ds in datasets:
+            spec = [ds.labels, ds.name]
+            for array in (ds.data, ds.targets):
+                memory = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[:] = array
+                self.memory.append(memory)
+                spec.append((memory.name, array.shape, array.dtype.str))
+            specs.append(spec)
+
+        self.pool = multiprocessing.Pool(workers, initializer=attach_datasets, initargs=(specs,))
+
+    def evaluator(self, i):
+        """
+        Gets something that scores populations on the ith data set, like a PopulationEvaluator
+        """
+
+        return PooledEvaluator(self, i)
+
+    def get_fitness_genomes(self, i, genomes, topology, num_inputs, num_outputs):
+        """
+        Get the fitness of every genome on the ith data set. The genomes are split evenly
+        between the workers, and the scores come back in the same order as the genomes
+        :param genomes: A 2-dimensional array of weights (nets, n_weights)
+        :return: A 1-dimensional array of fitness scores. 0 <= fitness <= 1
+        """
+
+        genomes = np.ascontiguousarray(genomes, dtype=neuralnet.weights_dtype(genomes))
+        tasks = [(i, chunk.tobytes(), genomes.dtype.str, topology, num_inputs, num_outputs)
+                 for chunk in np.array_split(genomes, min(self.workers, len(genomes))) if len(chunk) > 0]
+
+        if not tasks:
+            return np.zeros(0)
+
+        return np.concatenate(self.pool.map(evaluate_chunk, tasks))
+
+    def close(self):
+        """
+        Stops the workers and frees the shared memory
+        """
+
+        self.pool.close()
+        self.pool.join()
+
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+
+
+class PooledEvaluator:
+    """ Scores populations on one of an EvaluationPool's data sets """
+
+    def __init__(self, pool, i):
+        self.pool = pool
+        self.i = i
+        self.ds = pool.datasets[i]
+
+    def get_fitness_genomes(self, genomes, topology, num_inputs, num_outputs):
+        return self.pool.get_fitness_genomes(self.i, genomes, topology, num_inputs, num_outputs)
+
+
+def attach_datasets(specs):
+    """
+    Runs in each worker process when it starts. Finds the data sets in shared memory
+    """
+
+    for (labels, name, data_spec, targets_spec) in specs:
+        arrays = []
+        for (memory_name, shape, dtype) in (data_spec, targets_spec):
+            memory = shared_memory.SharedMemory(name=memory_name)
+            worker_memory.append(memory)
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=memory.buf))
+
+        worker_evaluators.append(PopulationEvaluator(Dataset(arrays[0], arrays[1], labels, name)))
+
+
+def evaluate_chunk(task):
+    """
+    Runs in a worker process. Scores a chunk of genomes sent as a raw float buffer
+    """
+
+    i, buffer, dtype, topology, num_inputs, num_outputs = task
+    genomes = np.frombuffer(buffer, dtype=dtype).reshape(-1, neuralnet.num_weights(topology, num_inputs, num_outputs))
+
+    return worker_evaluators[i].get_fitness_genomes(genomes, topology, num_inputs, num_outputs)
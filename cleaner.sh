@@ -1,3 +1,3 @@
 #!/bin/bash
 
-rm -rf generation* points.csv temp.net
\ No newline at end of file
+rm -rf generation* points.csv points.bin checkpoint.pkl timing.csv profile.pstats temp.net
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Plays the games that score asteroid nets, many at once. Every worker process writes
+the nets it is given to its own file, so no two games ever share a temp.net. The files
+are kept in a directory of the pool's own, which is removed when the pool is closed.
+"""
+
+import os
+import shutil
+import tempfile
+import multiprocessing
+import multiprocessing.util
+import neuralnet
+import nnrunner
+import numpy as np
+
+# how long a single game may take, in seconds
+TIMEOUT = 600
+# the score a game gets if it takes too long
+TIMEOUT_SCORE = 0
+
+
+class EpisodePool:
+    """ A pool of worker processes that play games with neural nets """
+
+    def __init__(self, workers, timeout=TIMEOUT):
+        """
+        :param workers: The number of worker processes. With 1 and no timeout, games are
+        played in this process
+        :param timeout: How long a single game may take, in seconds. None for no limit
+        """
+
+        self.workers = workers
+        self.timeout = timeout
+        self.pool = None
+        self.directory = tempfile.mkdtemp(prefix="nnrunner-")
+        # the directory is removed when the process exits too, if the pool was never closed,
+        # like in an island's process
+        self.remove_directory = multiprocessing.util.Finalize(self, shutil.rmtree, args=(self.directory, True),
+                                                              exitpriority=0)
+
+        # a game can only be stopped if it's in a process of its own
+        if workers > 1 or timeout is not None:
+            self.pool = multiprocessing.Pool(workers)
+
+    def run(self, nets, repeats):
+        """
+        Plays games with many nets at once
+        :param nets: A list of neural net objects
+        :param repeats: How many games to play with each net. Either one number, or one per net
+        :return: A list with a list of scores for each net
+        """
+
+        repeats = np.broadcast_to(repeats, len(nets))
+        tasks = [(self.directory, net.weights.tobytes(), net.weights.dtype.str, net.topology, net.num_inputs,
+                  net.num_outputs) for (net, count) in zip(nets, repeats) for i in range(0, count)]
+
+        if self.pool is None:
+            scores = [run_episode(task) for task in tasks]
+        else:
+            scores = self.run_pooled(tasks)
+
+        # hand each net back its own scores
+        splits = np.cumsum(repeats)[:-1]
+        return [list(x) for x in np.split(np.array(scores, dtype=float), splits)]
+
+    def run_pooled(self, tasks):
+        """
+        Plays games in the workers. A game that takes too long gets TIMEOUT_SCORE, and the
+        workers are restarted, since the game would otherwise keep one of them busy for good.
+        The games that hadn't finished by then are played again by the new workers
+        :param tasks: A list of games, like run_episode takes
+        :return: The score of each game
+        """
+
+        scores = [None] * len(tasks)
+        waiting = list(range(0, len(tasks)))
+
+        while waiting:
+            results = [(i, self.pool.apply_async(run_episode, (tasks[i],))) for i in waiting]
+            waiting = []
+
+            for (n, (i, result)) in enumerate(results):
+                try:
+                    scores[i] = result.get(self.timeout)
+                except multiprocessing.TimeoutError:
+                    print("A game took longer than " + str(self.timeout) + " seconds")
+                    scores[i] = TIMEOUT_SCORE
+
+                    # keep the games that are done, and play the rest again
+                    for (j, other) in results[n + 1:]:
+                        if other.ready():
+                            scores[j] = other.get()
+                        else:
+                            waiting.append(j)
+
+                    self.restart()
+                    break
+
+        return scores
+
+    def restart(self):
+        """
+        Kills the workers, along with whatever games they are playing, and starts new ones
+        """
+
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = multiprocessing.Pool(self.workers)
+
+    def close(self):
+        """
+        Stops the workers and removes their net files, along with any that workers killed
+        by restart left behind
+        """
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+
+        self.remove_directory()
+
+
+def run_episode(task):
+    """
+    Plays one game. Runs in a worker process
+    :param task: The pool's directory, the net's weights as a raw float buffer and their
+    dtype, and its topology, inputs and outputs
+    :return: The score
+    """
+
+    directory, buffer, dtype, topology, num_inputs, num_outputs = task
+    net = neuralnet.FFNN(topology, num_inputs, num_outputs, np.frombuffer(buffer, dtype=dtype).copy())
+
+    # each process has a file of its own to give the runner
+    fname = os.path.join(directory, str(os.getpid()) + ".net")
+    neuralnet.to_file(fname, net)
+
+    return nnrunner.run(fname)
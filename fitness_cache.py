@@ -0,0 +1,99 @@
+"""
+A cache of fitness scores, keyed by a hash of the genome's weights and the data set
+it was scored on. Clones of an organism, and organisms that survive into the next
+generation, don't need to be scored again.
+"""
+
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+# how many genomes to remember by default
+CACHE_SIZE = 100000
+
+
+class FitnessCache:
+    """ A bounded least-recently-used cache of fitness scores """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, genome, ds=''):
+        """
+        Get the fitness of a genome
+        :param genome: The weights of the net
+        :param ds: What the genome was scored on. Usually the data set's filename
+        :return: The fitness, or the mean fitness if it was scored more than once. None
+        if the genome hasn't been scored
+        """
+
+        key = make_key(genome, ds)
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+
+        return entry[0]
+
+    def samples(self, genome, ds=''):
+        """
+        Get how many times a genome has been scored. This doesn't count as a hit or a miss
+        """
+
+        entry = self.entries.get(make_key(genome, ds))
+
+        return 0 if entry is None else entry[1]
+
+    def put(self, genome, fitness, ds=''):
+        """
+        Remember the fitness of a genome, replacing whatever was remembered before
+        """
+
+        self.store(make_key(genome, ds), [fitness, 1])
+
+    def add(self, genome, scores, ds=''):
+        """
+        Fold more scores of a genome into its running mean. This is for noisy fitness
+        functions, where every score is just a sample. Having to play more samples counts as a miss
+        :param scores: A list of scores
+        :return: The new mean fitness
+        """
+
+        key = make_key(genome, ds)
+        mean, count = self.entries.get(key, [0.0, 0])
+        self.misses += 1
+
+        count += len(scores)
+        mean += (np.sum(scores) - len(scores) * mean) / count
+
+        self.store(key, [mean, count])
+
+        return mean
+
+    def store(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        # forget the least recently used genomes
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+def make_key(genome, ds):
+    """
+    Makes the cache key of a genome. Genomes with the same weights have the same key
+    """
+
+    digest = hashlib.blake2b(np.ascontiguousarray(genome).tobytes(), digest_size=16).digest()
+
+    return ds, digest
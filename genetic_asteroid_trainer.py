@@ -2,29 +2,67 @@ import sys
 import getopt
 import neuralnet
 import os
-import nnrunner
+import episode_pool
+import fitness_cache
+import selection
+from population import Population
+import telemetry
+import checkpoint
+import islands
+import profiling
 import numpy as np
 
 # constants
 NET_INPUTS = 6
 NET_OUTPUTS = 3
 INIT_DIR = "generationinit"
+ARCHIVE_FNAME = "population.arc"
+SELECT = "roulette"
 NUM_AVERAGE = 3
 
+# games are noisy, so this keeps the running mean score of each genome
+cache = fitness_cache.FitnessCache()
+# plays the games
+episodes = None
+# times each phase of a generation
+timer = profiling.Timer(profiling.GA_PHASES)
+
 
 def main(argv):
 
     # How the program is to be used
     usage = "\tusage: --pop=[population size] --it=[number of iterations] --surv=[chance to survive]" \
-            " --topology=[layer1,layer2,etc]\n"
-
-    optlist, args = getopt.getopt(argv[1:], "h", ["help", "pop=", "it=", "surv=", "topology="])
+            " --topology=[layer1,layer2,etc] --workers=[# of games at once] --timeout=[seconds per game]" \
+            " --select=[" + "|".join(selection.SCHEMES) + "]" \
+            " --telemetry=[csv|bin|both] --sample=[all|summary]" \
+            " --resume --checkpoint=[save every # iterations]" \
+            " --islands=[# of islands] --migrate=[every # iterations] --migrants=[# per migration]" \
+            " --connect=[ring|full] --profile=[first:last generation to profile]" \
+            " --dtype=[" + "|".join(neuralnet.DTYPES) + "]\n"
+
+    optlist, args = getopt.getopt(argv[1:], "h", ["help", "pop=", "it=", "surv=", "topology=",
+                                                  "workers=", "timeout=", "select=", "telemetry=", "sample=",
+                                                  "resume", "checkpoint=", "islands=", "migrate=", "migrants=",
+                                                  "connect=", "profile=", "dtype="])
 
     # default parameters
     population_size = 100
     num_iterations = 100
+    telemetry_format = "csv"
+    sample = "all"
+    resume = False
+    checkpoint_every = checkpoint.CHECKPOINT_EVERY
     survival_percentage = .3
     topology = []
+    workers = 1
+    select = SELECT
+    timeout = episode_pool.TIMEOUT
+    num_islands = 1
+    migrate_every = islands.MIGRATE_EVERY
+    migrants = islands.MIGRANTS
+    connect = "ring"
+    profile = None
+    dtype = "float64"
 
     # replace the parameters
     for key, val in optlist:
@@ -35,12 +73,57 @@ def main(argv):
             population_size = int(val)
         elif key == "--it":
             num_iterations = int(val)
+        elif key == "--telemetry":
+            telemetry_format = val
+        elif key == "--sample":
+            sample = val
+        elif key == "--resume":
+            resume = True
+        elif key == "--checkpoint":
+            checkpoint_every = int(val)
         elif key == "--surv":
             survival_percentage = float(val)
         elif key == "--topology":
             entries = val.split(",")
             for entry in entries:
                 topology.append(int(entry))
+        elif key == "--workers":
+            workers = int(val)
+        elif key == "--select":
+            select = val
+        elif key == "--timeout":
+            timeout = float(val)
+        elif key == "--islands":
+            num_islands = int(val)
+        elif key == "--migrate":
+            migrate_every = int(val)
+        elif key == "--migrants":
+            migrants = int(val)
+        elif key == "--connect":
+            connect = val
+        elif key == "--profile":
+            profile = profiling.parse_range(val)
+        elif key == "--dtype":
+            dtype = val
+
+    if telemetry_format not in telemetry.FORMATS or sample not in telemetry.SAMPLES:
+        print("Unknown telemetry format or sample. Use -h or --help for help")
+        return
+
+    if dtype not in neuralnet.DTYPES:
+        print("Unknown dtype " + dtype + ". Use -h or --help for help")
+        return
+
+    if select not in selection.SCHEMES:
+        print("Unknown selection scheme " + select + ". Use -h or --help for help")
+        return
+
+    if connect not in islands.CONNECTIONS:
+        print("Unknown island connection " + connect + ". Use -h or --help for help")
+        return
+    if num_islands > 1 and resume:
+        print("Island runs can't be resumed. Use -h or --help for help")
+        return
 
     # can't run without a topology
     if not topology:
@@ -49,109 +132,177 @@ def main(argv):
 
     cutoff_point = int(survival_percentage * population_size)
 
-    brains = generate_brains(population_size, topology)
+    if num_islands > 1:
+        # every island plays its own games, --workers at a time
+        settings = {'workers': workers, 'timeout': timeout, 'population_size': population_size,
+                    'topology': topology, 'cutoff_point': cutoff_point, 'select': select,
+                    'dtype': neuralnet.DTYPES[dtype]}
+
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample)
+        try:
+            islands.coordinate(num_islands, island_start, island_step, settings, num_iterations, points,
+                               migrate_every, migrants, connect)
+        finally:
+            points.close()
+        return
 
-    # open the points file
-    points = open("points.csv", "w")
-    points.truncate()
+    global episodes
+    episodes = episode_pool.EpisodePool(workers, timeout)
+
+    # carry on from the last checkpoint, or start from scratch
+    global cache
+    global timer
+    state = checkpoint.resume() if resume else None
+    timer = profiling.Timer(profiling.GA_PHASES, profiling.TIMING_FNAME, profile,
+                            resume=None if state is None else state['iteration'] + 1)
+    if state is None:
+        timer.start_generation(0)
+        with timer.phase('generate_brains'):
+            brains = generate_brains(population_size, topology, neuralnet.DTYPES[dtype])
+        timer.end_generation(0)
+        first_iteration = 0
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample)
+    else:
+        brains = state['brains']
+        cache = state['cache']
+        first_iteration = state['iteration'] + 1
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample, sizes=state['points'])
+
+    # whatever has been recorded is written even if the run crashes
+    try:
+        for iteration in range(first_iteration, num_iterations):
+            print("Generation " + str(iteration + 1))
+            timer.start_generation(iteration + 1)
+
+            # make the directory if it doesn't exist
+            dirname = "generation" + str(iteration + 1)
+            with timer.phase('directories'):
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname)
+
+            brains = next_generation(brains, iteration, population_size, cutoff_point, select)
+
+            # write the whole generation to one file
+            with timer.phase('archive'):
+                brains.to_archive(dirname + "/" + ARCHIVE_FNAME)
 
-    for iteration in range(0, num_iterations):
-        print("Generation " + str(iteration + 1))
+            # write out to the index and the points
+            with timer.phase('telemetry'):
+                points.index(dirname + "/index.csv", brains.fitness, brains.names())
+                points.record(iteration, brains.fitness)
 
-        # make the directory if it doesn't exist
-        dirname = "generation" + str(iteration + 1)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
+            # save where the run is up to every so often
+            if (iteration + 1) % checkpoint_every == 0 or iteration == num_iterations - 1:
+                with timer.phase('checkpoint'):
+                    checkpoint.save(checkpoint.CHECKPOINT_FNAME, {'iteration': iteration, 'brains': brains,
+                                                                  'cache': cache, 'points': points.sizes()})
 
-        # the index file
-        index = open(dirname + "/index.csv", "w")
+            timer.end_generation(iteration + 1)
+    finally:
+        points.close()
+        timer.close()
+    episodes.close()
 
-        # kill stuff
-        fits = [x['fitness'] for x in brains]
-        dist = [x / np.sum(fits) for x in fits]
-        brains = list(np.random.choice(brains, size=cutoff_point, p=dist, replace=False))
+    print("Fitness cache: " + str(cache.hits) + " hits, " + str(cache.misses) + " misses")
 
-        repopulate(brains, population_size, iteration)
 
-        for organism in brains:
-            # write to file
-            organismfilename = dirname + "/" + organism['name']
-            neuralnet.to_file(organismfilename, organism['net'])
+def next_generation(brains, iteration, population_size, cutoff_point, select):
+    """
+    Kills off the weak and breeds the survivors back up to size
+    :return: The new population
+    """
 
-            # write out to the index and the points
-            index.write(str(organism['fitness']) + "," + organismfilename.split('/')[-1] + "\n")
-            points.write(str(iteration) + "," + str(organism['fitness']) + "\n")
+    # kill stuff
+    with timer.phase('select'):
+        brains = brains.select(selection.roulette(brains.fitness, cutoff_point, replace=False))
 
-        index.close()
+    with timer.phase('repopulate'):
+        repopulate(brains, population_size, iteration, select)
 
-    points.close()
+    return brains
 
 
-def generate_brains(population, topology):
-    brains = []
+def island_start(island, settings):
+    """
+    Sets up an island's process and makes its population. See islands.run
+    """
 
-    # make a directory
-    if not os.path.exists(INIT_DIR):
-        os.makedirs(INIT_DIR)
+    global episodes
+    episodes = episode_pool.EpisodePool(settings['workers'], settings['timeout'])
 
-    for i in range(0, population):
-        organism = {
-            'net': neuralnet.FFNN(topology, NET_INPUTS, NET_OUTPUTS),
-            'name': "0-" + str(i) + ".net",
-            'gen': 2}
+    return generate_brains(settings['population_size'], settings['topology'], settings['dtype'],
+                           "island" + str(island) + ".arc")
 
-        # write it out and evaluate
-        neuralnet.to_file(INIT_DIR + "/" + organism['name'], organism['net'])
-        organism['fitness'] = get_fitness(INIT_DIR + "/" + organism['name'])
 
-        brains.append(organism)
+def island_step(brains, iteration, island, settings):
+    """
+    Runs one generation of an island, and writes it to its own file. See islands.run
+    """
 
-    return brains
+    brains = next_generation(brains, iteration, settings['population_size'], settings['cutoff_point'],
+                             settings['select'])
 
+    dirname = "generation" + str(iteration + 1)
+    os.makedirs(dirname, exist_ok=True)
+    brains.to_archive(dirname + "/island" + str(island) + ".arc")
 
-def repopulate(brains, population, generation):
+    return brains, []
 
-    orgnum = 0
 
-    diff = population - len(brains)
+def generate_brains(population, topology, dtype=np.float64, archive_fname=ARCHIVE_FNAME):
 
-    # make the fitnesses into a probability distribution
-    fits = [x['fitness'] for x in brains]
-    dist = [x / np.sum(fits) for x in fits]
+    # make a directory. Islands may be making it at the same time
+    os.makedirs(INIT_DIR, exist_ok=True)
 
-    parents = np.random.choice(brains, size=(diff * 2), p=dist)
+    brains = Population.random(population, topology, NET_INPUTS, NET_OUTPUTS, dtype)
 
-    for i in range(0, len(parents), 2):
+    # evaluate them all at once, and write them out
+    brains.fitness = get_fitness(brains.nets())
+    brains.to_archive(INIT_DIR + "/" + archive_fname)
 
-        child1, child2 = neuralnet.sp_crossover(parents[i]['net'], parents[i + 1]['net'])
-        #child1, child2 = neuralnet.u_crossover(parents[i]['net'], parents[i + 1]['net'])
+    return brains
 
-        neuralnet.to_file("temp.net", child1)
-        score1 = get_fitness("temp.net")
 
-        neuralnet.to_file("temp.net", child2)
-        score2 = get_fitness("temp.net")
+def repopulate(brains, population, generation, select=SELECT):
 
-        organism = {'name': str(generation + 1) + "-" + str(orgnum) + ".net",
-                    'gen': 2}
+    diff = population - len(brains)
 
-        # only the strong are cared for
-        if score1 > score2:
-            organism['fitness'] = score1
-            organism['net'] = child1
-        else:
-            organism['fitness'] = score2
-            organism['net'] = child2
+    # pick the parents by their fitness
+    parents = selection.SCHEMES[select](brains.fitness, diff * 2)
+
+    children = neuralnet.make_children(brains.genomes, parents)
+    #children = neuralnet.make_children(brains.genomes, parents, uniform=True)
 
-        brains.append(organism)
-        orgnum += 1
+    # play all the children's games at once
+    scores = get_fitness([neuralnet.FFNN(brains.topology, NET_INPUTS, NET_OUTPUTS, x) for x in children])
 
+    # only the strong are cared for
+    best = np.arange(0, len(children), 2) + (scores[0::2] <= scores[1::2])
+
+    brains.add_children(children[best], scores[best], generation + 1, parents.reshape(-1, 2))
+
+
+def get_fitness(nets):
+    """
+    Scores nets by their mean over NUM_AVERAGE games. Only the games the cache
+    doesn't already have are played, and they are all played at once
+    :param nets: A list of neural net objects
+    :return: A 1-dimensional array of mean scores
+    """
+
+    needed = [max(0, NUM_AVERAGE - cache.samples(x.weights)) for x in nets]
+    with timer.phase('evaluation'):
+        scores = episodes.run(nets, needed)
+    timer.count(sum(needed))
+
+    fits = []
+    for (net, count, net_scores) in zip(nets, needed, scores):
+        if count > 0:
+            fits.append(cache.add(net.weights, net_scores))
+        else:
+            fits.append(cache.get(net.weights))
 
-def get_fitness(fname):
-    scores = []
-    for i in range(0, NUM_AVERAGE):
-        scores.append(nnrunner.run(fname))
-    return np.mean(scores)
+    return np.array(fits)
 
 
 # This is here to ensure main is only called when
@@ -3,12 +3,22 @@ import getopt
 import neuralnet
 import os
 import classifier_fitness as cf
+import fitness_cache
+import selection
+from population import Population
+import telemetry
+import checkpoint
+import islands
+import profiling
 import numpy as np
 
 # constants
 NET_INPUTS = 4
 NET_OUTPUTS = 3
 INIT_DIR = "generationinit"
+ARCHIVE_FNAME = "population.arc"
+SELECT = "roulette"
+VALIDATE = "all"
 NUM_AVERAGE = 3
 DATASET_FNAME = "/home/justin/data/iris.csv"
 
@@ -18,22 +28,54 @@ num_inputs = NET_INPUTS
 num_outputs = NET_OUTPUTS
 testing_set = ''
 training_set = ''
+testing_evaluator = None
+training_evaluator = None
+cache = fitness_cache.FitnessCache()
+timer = profiling.Timer(profiling.GA_PHASES)
 
 
 def main(argv):
 
     # How the program is to be used
     usage = "\tusage: --pop=[population size] --it=[number of iterations] --surv=[chance to survive]" \
-            " --topology=[layer1,layer2,etc] --ds=[dataset filename] --in[# of inputs] --out[# of outputs]\n"
+            " --topology=[layer1,layer2,etc] --ds=[dataset filename] --in[# of inputs] --out[# of outputs]" \
+            " --workers=[# of processes to evaluate with] --select=[" + "|".join(selection.SCHEMES) + "]" \
+            " --validate=[all|changed|every:N|elites:K]" \
+            " --telemetry=[csv|bin|both] --sample=[all|summary]" \
+            " --resume --checkpoint=[save every # iterations]" \
+            " --islands=[# of islands] --migrate=[every # iterations] --migrants=[# per migration]" \
+            " --connect=[ring|full] --profile=[first:last generation to profile]" \
+            " --batch=[# of rows to score on at first] --growth=[batch growth per iteration] --adaptive" \
+            " --race --dtype=[" + "|".join(neuralnet.DTYPES) + "]\n"
 
     optlist, args = getopt.getopt(argv[1:], "h", ["help", "pop=", "it=", "surv=",
-                                                  "topology=", "ds=", "in=", "out="])
+                                                  "topology=", "ds=", "in=", "out=", "workers=", "select=",
+                                                  "validate=", "telemetry=", "sample=", "resume", "checkpoint=",
+                                                  "islands=", "migrate=", "migrants=", "connect=", "profile=",
+                                                  "batch=", "growth=", "adaptive", "race", "dtype="])
 
     # default parameters
     population_size = 100
     num_iterations = 100
+    telemetry_format = "csv"
+    sample = "all"
+    resume = False
+    checkpoint_every = checkpoint.CHECKPOINT_EVERY
     survival_percentage = .3
     topology = []
+    workers = 1
+    select = SELECT
+    validate = VALIDATE
+    num_islands = 1
+    migrate_every = islands.MIGRATE_EVERY
+    migrants = islands.MIGRANTS
+    connect = "ring"
+    profile = None
+    batch = 0
+    growth = cf.BATCH_GROWTH
+    adaptive = False
+    race = False
+    dtype = "float64"
     global dataset
     global num_inputs
     global num_outputs
@@ -47,6 +89,14 @@ def main(argv):
             population_size = int(val)
         elif key == "--it":
             num_iterations = int(val)
+        elif key == "--telemetry":
+            telemetry_format = val
+        elif key == "--sample":
+            sample = val
+        elif key == "--resume":
+            resume = True
+        elif key == "--checkpoint":
+            checkpoint_every = int(val)
         elif key == "--surv":
             survival_percentage = float(val)
         elif key == "--topology":
@@ -59,6 +109,63 @@ def main(argv):
             num_inputs = int(val)
         elif key == "--out":
             num_outputs = int(val)
+        elif key == "--workers":
+            workers = int(val)
+        elif key == "--select":
+            select = val
+        elif key == "--validate":
+            validate = val
+        elif key == "--islands":
+            num_islands = int(val)
+        elif key == "--migrate":
+            migrate_every = int(val)
+        elif key == "--migrants":
+            migrants = int(val)
+        elif key == "--connect":
+            connect = val
+        elif key == "--profile":
+            profile = profiling.parse_range(val)
+        elif key == "--dtype":
+            dtype = val
+        elif key == "--batch":
+            batch = int(val)
+        elif key == "--growth":
+            growth = float(val)
+        elif key == "--adaptive":
+            adaptive = True
+        elif key == "--race":
+            race = True
+
+    if telemetry_format not in telemetry.FORMATS or sample not in telemetry.SAMPLES:
+        print("Unknown telemetry format or sample. Use -h or --help for help")
+        return
+
+    if dtype not in neuralnet.DTYPES:
+        print("Unknown dtype " + dtype + ". Use -h or --help for help")
+        return
+
+    if select not in selection.SCHEMES:
+        print("Unknown selection scheme " + select + ". Use -h or --help for help")
+        return
+
+    policy, _, count = validate.partition(":")
+    if policy not in ("all", "changed", "every", "elites") or (policy in ("every", "elites")) != count.isdigit() \
+            or (count.isdigit() and int(count) < 1):
+        print("Unknown validation policy " + validate + ". Use -h or --help for help")
+        return
+
+    if connect not in islands.CONNECTIONS:
+        print("Unknown island connection " + connect + ". Use -h or --help for help")
+        return
+    if num_islands > 1 and resume:
+        print("Island runs can't be resumed. Use -h or --help for help")
+        return
+    if batch > 0 and workers > 1:
+        print("Mini-batches can't be scored by more than one worker. Use -h or --help for help")
+        return
+    if race and workers > 1:
+        print("Siblings can't be raced by more than one worker. Use -h or --help for help")
+        return
 
     # can't run without a topology
     if not topology:
@@ -71,107 +178,311 @@ def main(argv):
     # split up into testing and training sets
     global testing_set
     global training_set
-    testing_set, training_set = cf.make_te_tr_sets(dataset)
+    training_set, testing_set = cf.make_te_tr_sets(dataset)
 
     cutoff_point = int(survival_percentage * population_size)
 
-    brains = generate_brains(population_size, topology)
+    if num_islands > 1:
+        # parse the sets here, so the islands only read the shards rather than all writing them at once
+        cf.load_dataset(training_set)
+        cf.load_dataset(testing_set)
+
+        # each island scores its own organisms, so the islands are the workers
+        settings = {'num_inputs': num_inputs, 'num_outputs': num_outputs, 'testing_set': testing_set,
+                    'training_set': training_set, 'population_size': population_size, 'topology': topology,
+                    'num_iterations': num_iterations, 'cutoff_point': cutoff_point, 'select': select,
+                    'validate': validate, 'batch': batch, 'growth': growth, 'adaptive': adaptive,
+                    'race': race, 'dtype': neuralnet.DTYPES[dtype]}
+
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample)
+        try:
+            islands.coordinate(num_islands, island_start, island_step, settings, num_iterations, points,
+                               migrate_every, migrants, connect)
+        finally:
+            points.close()
+        return
+
+    # parse the sets once, so whole populations can be scored against them
+    global testing_evaluator
+    global training_evaluator
+    pool = None
+    if workers > 1:
+        # the workers get the sets through shared memory
+        pool = cf.EvaluationPool([cf.load_dataset(testing_set), cf.load_dataset(training_set)], workers)
+        testing_evaluator = pool.evaluator(0)
+        training_evaluator = pool.evaluator(1)
+    else:
+        testing_evaluator = cf.PopulationEvaluator(cf.load_dataset(testing_set))
+        training_evaluator = make_training_evaluator(training_set, batch, growth, adaptive)
+
+    # carry on from the last checkpoint, or start from scratch
+    global cache
+    global timer
+    state = checkpoint.resume() if resume else None
+    timer = profiling.Timer(profiling.GA_PHASES, profiling.TIMING_FNAME, profile,
+                            resume=None if state is None else state['iteration'] + 1)
+    if state is None:
+        timer.start_generation(0)
+        with timer.phase('generate_brains'):
+            brains = generate_brains(population_size, topology, neuralnet.DTYPES[dtype])
+        timer.end_generation(0)
+        first_iteration = 0
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample)
+    else:
+        brains = state['brains']
+        cache = state['cache']
+        # the mini-batches carry on where they were, or start now if the run didn't use them
+        if batch > 0 and state['batch'] is not None:
+            training_evaluator.size, training_evaluator.samples = state['batch']
+        first_iteration = state['iteration'] + 1
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample, sizes=state['points'])
+
+    # whatever has been recorded is written even if the run crashes
+    try:
+        for iteration in range(first_iteration, num_iterations):
+            print("Generation " + str(iteration + 1))
+            timer.start_generation(iteration + 1)
+
+            # make the directory if it doesn't exist
+            dirname = "generation" + str(iteration + 1)
+            with timer.phase('directories'):
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname)
+
+            brains, test_scores = next_generation(brains, iteration, num_iterations, population_size,
+                                                  cutoff_point, select, validate, race)
+
+            # write the whole generation to one file
+            with timer.phase('archive'):
+                brains.to_archive(dirname + "/" + ARCHIVE_FNAME)
+
+            # write out to the index and the points
+            with timer.phase('telemetry'):
+                points.index(dirname + "/index.csv", brains.fitness, brains.names())
+                points.record(iteration, brains.fitness, test_scores)
 
-    # open the points file
-    points = open("points.csv", "w")
-    points.truncate()
+            # save where the run is up to every so often
+            if (iteration + 1) % checkpoint_every == 0 or iteration == num_iterations - 1:
+                with timer.phase('checkpoint'):
+                    checkpoint.save(checkpoint.CHECKPOINT_FNAME, {'iteration': iteration, 'brains': brains,
+                                                                  'cache': cache, 'points': points.sizes(),
+                                                                  'batch': batch_state()})
 
-    for iteration in range(0, num_iterations):
-        print("Generation " + str(iteration + 1))
+            timer.end_generation(iteration + 1)
+    finally:
+        points.close()
+        timer.close()
 
-        # make the directory if it doesn't exist
-        dirname = "generation" + str(iteration + 1)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
+    if pool is not None:
+        pool.close()
 
-        # the index file
-        index = open(dirname + "/index.csv", "w")
+    print("Fitness cache: " + str(cache.hits) + " hits, " + str(cache.misses) + " misses")
 
-        # kill stuff
-        fits = [x['fitness'] for x in brains]
-        dist = [x / np.sum(fits) for x in fits]
-        brains = list(np.random.choice(brains, size=cutoff_point, p=dist, replace=False))
 
-        repopulate(brains, population_size, iteration)
+def next_generation(brains, iteration, num_iterations, population_size, cutoff_point, select, validate,
+                    race=False):
+    """
+    Kills off the weak, breeds the survivors back up to size, and scores some of the
+    population on the testing set
+    :return: The new population, and its testing set scores. nan where it wasn't scored
+    """
 
-        for organism in brains:
-            # write to file
-            organismfilename = dirname + "/" + organism['name']
-            neuralnet.to_file(organismfilename, organism['net'])
+    # with mini-batches, everyone is scored again on a new subset, survivors too
+    if isinstance(training_evaluator, cf.MiniBatchEvaluator):
+        training_evaluator.resample(brains.fitness)
+        brains.fitness = get_fitness(training_evaluator, brains.genomes, brains.topology)
 
-            # testing set
-            test_score = get_fitness(testing_set, organism['net'])
+    # kill stuff
+    with timer.phase('select'):
+        brains = brains.select(selection.roulette(brains.fitness, cutoff_point, replace=False))
 
-            # write out to the index and the points
-            index.write(str(organism['fitness']) + "," + organismfilename.split('/')[-1] + "\n")
-            points.write(str(iteration) + "," + str(organism['fitness']) + "," + str(test_score) + "\n")
+    with timer.phase('repopulate'):
+        repopulate(brains, population_size, iteration, select, race)
 
-        index.close()
+    # testing set. Only some organisms are scored, and the rest are left as nan
+    test_scores = np.full(len(brains), np.nan)
+    rows = validation_rows(brains, validate, iteration, num_iterations)
+    test_scores[rows] = get_fitness(testing_evaluator, brains.genomes[rows], brains.topology)
 
-    points.close()
+    return brains, test_scores
 
 
-def generate_brains(population, topology):
-    brains = []
+def island_start(island, settings):
+    """
+    Sets up an island's process and makes its population. See islands.run
+    """
 
-    # make a directory
-    if not os.path.exists(INIT_DIR):
-        os.makedirs(INIT_DIR)
+    global num_inputs
+    global num_outputs
+    global testing_evaluator
+    global training_evaluator
+    num_inputs = settings['num_inputs']
+    num_outputs = settings['num_outputs']
+    testing_evaluator = cf.PopulationEvaluator(cf.load_dataset(settings['testing_set']))
+    training_evaluator = make_training_evaluator(settings['training_set'], settings['batch'], settings['growth'],
+                                                 settings['adaptive'])
 
-    for i in range(0, population):
-        organism = {
-            'net': neuralnet.FFNN(topology, num_inputs, num_outputs),
-            'name': "0-" + str(i) + ".net"}
+    return generate_brains(settings['population_size'], settings['topology'], settings['dtype'])
 
-        # write it out and evaluate
-        organism['fitness'] = get_fitness(training_set, organism['net'])
 
-        brains.append(organism)
+def island_step(brains, iteration, island, settings):
+    """
+    Runs one generation of an island, and writes it to its own file. See islands.run
+    """
 
-    return brains
+    brains, test_scores = next_generation(brains, iteration, settings['num_iterations'],
+                                          settings['population_size'], settings['cutoff_point'],
+                                          settings['select'], settings['validate'], settings['race'])
 
+    dirname = "generation" + str(iteration + 1)
+    os.makedirs(dirname, exist_ok=True)
+    brains.to_archive(dirname + "/island" + str(island) + ".arc")
 
-def repopulate(brains, population, generation):
+    return brains, [test_scores]
 
-    orgnum = 0
 
-    diff = population - len(brains)
+def make_training_evaluator(training_set, batch, growth, adaptive):
+    """
+    Makes what scores populations on the training set
+    :param batch: How many rows to score on at first. 0 to always score on all of them
+    :return: A MiniBatchEvaluator, or a PopulationEvaluator if batch is 0
+    """
 
-    # make the fitnesses into a probability distribution
-    fits = [x['fitness'] for x in brains]
-    dist = [x / np.sum(fits) for x in fits]
+    ds = cf.load_dataset(training_set)
 
-    parents = np.random.choice(brains, size=(diff * 2), p=dist)
+    if batch > 0:
+        return cf.MiniBatchEvaluator(ds, batch, growth, adaptive)
 
-    for i in range(0, len(parents), 2):
+    return cf.PopulationEvaluator(ds)
 
-        child1, child2 = neuralnet.sp_crossover(parents[i]['net'], parents[i + 1]['net'])
-        #child1, child2 = neuralnet.u_crossover(parents[i]['net'], parents[i + 1]['net'])
 
-        score1 = get_fitness(training_set, child1)
-        score2 = get_fitness(training_set, child2)
+def batch_state():
+    """
+    Gets what's needed to carry on with the same mini-batches when resuming
+    """
 
-        organism = {'name': str(generation + 1) + "-" + str(orgnum) + ".net"}
+    if isinstance(training_evaluator, cf.MiniBatchEvaluator):
+        return training_evaluator.size, training_evaluator.samples
 
-        # only the strong are cared for
-        if score1 > score2:
-            organism['fitness'] = score1
-            organism['net'] = child1
-        else:
-            organism['fitness'] = score2
-            organism['net'] = child2
+    return None
+
+
+def generate_brains(population, topology, dtype=np.float64):
+
+    # make a directory. Islands may be making it at the same time
+    os.makedirs(INIT_DIR, exist_ok=True)
+
+    brains = Population.random(population, topology, num_inputs, num_outputs, dtype)
 
-        brains.append(organism)
-        orgnum += 1
+    # evaluate them all at once
+    brains.fitness = get_fitness(training_evaluator, brains.genomes, topology)
+
+    return brains
+
+
+def repopulate(brains, population, generation, select=SELECT, race=False):
+
+    diff = population - len(brains)
+
+    # pick the parents by their fitness
+    parents = selection.SCHEMES[select](brains.fitness, diff * 2)
+
+    # make all the children at once, and evaluate them all at once
+    children = neuralnet.make_children(brains.genomes, parents)
+    #children = neuralnet.make_children(brains.genomes, parents, uniform=True)
+
+    # only the strong are cared for
+    if race:
+        best, scores = race_children(training_evaluator, children, brains.topology)
+    else:
+        scores = get_fitness(training_evaluator, children, brains.topology)
+        best = np.arange(0, len(children), 2) + (scores[0::2] <= scores[1::2])
+        scores = scores[best]
+
+    brains.add_children(children[best], scores, generation + 1, parents.reshape(-1, 2))
+
+
+def race_children(evaluator, children, topology):
+    """
+    Finds the fitter of each pair of siblings, only scoring them until the winner is
+    certain. The winners are the same as if both were fully scored
+    :param evaluator: The PopulationEvaluator of the data set to score on
+    :param children: A 2-dimensional array of weights. Rows 2i and 2i+1 are siblings
+    :param topology: The children's topology
+    :return: The rows of the winners, and their fitness
+    """
+
+    ds = evaluator.ds.name
+
+    known = np.full(len(children), np.nan)
+    for i in range(0, len(children)):
+        score = cache.get(children[i], ds)
+        if score is not None:
+            known[i] = score
+
+    with timer.phase('evaluation'):
+        best, scores = evaluator.race_pairs(children, topology, num_inputs, num_outputs, known)
+    timer.count(np.count_nonzero(np.isnan(known)))
+
+    # only the winners' scores are exact, so they're the only ones cached
+    for (i, score) in zip(best, scores):
+        cache.put(children[i], score, ds)
+
+    return best, scores
+
+
+def validation_rows(brains, validate, iteration, num_iterations):
+    """
+    Picks the organisms to score on the testing set this generation
+    :param brains: The population
+    :param validate: The validation policy. all, changed (only genomes that haven't been
+    scored on the testing set before), every:N (everything, every N generations and the
+    last generation) or elites:K (the K fittest on the training set)
+    :return: The rows of the population to score
+    """
+
+    policy, _, count = validate.partition(":")
+
+    if policy == "every":
+        if (iteration + 1) % int(count) != 0 and iteration != num_iterations - 1:
+            return np.zeros(0, dtype=int)
+    elif policy == "elites":
+        return selection.truncation(brains.fitness, min(int(count), len(brains)))
+    elif policy == "changed":
+        ds = testing_evaluator.ds.name
+        return np.array([i for i in range(0, len(brains)) if cache.samples(brains.genomes[i], ds) == 0], dtype=int)
+
+    return np.arange(len(brains))
+
+
+def get_fitness(evaluator, genomes, topology):
+    """
+    Scores a matrix of genomes, only evaluating the ones that aren't in the cache
+    :param evaluator: The PopulationEvaluator of the data set to score on
+    :param genomes: A 2-dimensional array of weights (organisms, n_weights)
+    :param topology: The genomes' topology
+    :return: A 1-dimensional array of fitness scores
+    """
+
+    ds = evaluator.ds.name
+    scores = np.empty(len(genomes))
+
+    missing = []
+    for i in range(0, len(genomes)):
+        score = cache.get(genomes[i], ds)
+        if score is None:
+            missing.append(i)
+        else:
+            scores[i] = score
 
+    if missing:
+        with timer.phase('evaluation'):
+            scores[missing] = evaluator.get_fitness_genomes(genomes[missing], topology, num_inputs, num_outputs)
+        timer.count(len(missing))
+        for i in missing:
+            cache.put(genomes[i], scores[i], ds)
 
-def get_fitness(ds, net):
-    return cf.get_fitness_file(ds, net)
+    return scores
 
 
 # This is here to ensure main is only called when
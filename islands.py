@@ -0,0 +1,184 @@
+"""
+The island model. Several populations evolve on their own, each in its own process, and
+every so often the fittest organisms of each island migrate to its neighbours. Islands
+never wait for each other: migrants are taken in whenever they have arrived. Genomes
+travel between processes as raw float buffers, in the population's precision.
+"""
+
+import multiprocessing
+import queue
+import random
+import traceback
+import selection
+import numpy as np
+
+CONNECTIONS = ('ring', 'full')
+# how many generations between migrations, and how many organisms migrate, by default
+MIGRATE_EVERY = 10
+MIGRANTS = 2
+
+
+def neighbours(island, count, connect='ring'):
+    """
+    Gets the islands that an island sends its migrants to
+    :param island: The island
+    :param count: How many islands there are
+    :param connect: ring, to send them on to the next island, or full, to send them to every other island
+    :return: A list of islands
+    """
+
+    if connect == 'ring':
+        return [(island + 1) % count] if count > 1 else []
+
+    return [i for i in range(0, count) if i != island]
+
+
+def run(count, start, step, settings, num_iterations, migrate_every=MIGRATE_EVERY, migrants=MIGRANTS,
+        connect='ring'):
+    """
+    Runs the islands, each in its own process, and hands back their reports as they come in
+    :param count: How many islands to run
+    :param start: A function (island, settings) that sets up an island's process and returns
+    its Population. It's run in the island's process
+    :param step: A function (brains, iteration, island, settings) that runs one generation.
+    It returns the new Population and a list of any other per-organism columns to report.
+    It's run in the island's process
+    :param settings: Whatever start and step need. It has to be picklable
+    :param num_iterations: How many generations each island runs
+    :param migrate_every: How many generations between migrations
+    :param migrants: How many of its fittest organisms each island sends to each neighbour
+    :param connect: ring or full. See neighbours
+    :return: A generator of reports, one per island per generation.
+    (island, iteration, fitness, names, columns)
+    """
+
+    inboxes = [multiprocessing.Queue() for i in range(0, count)]
+    reports = multiprocessing.Queue()
+
+    processes = []
+    for island in range(0, count):
+        outboxes = [inboxes[i] for i in neighbours(island, count, connect)]
+        processes.append(multiprocessing.Process(target=run_island, args=(
+            start, step, settings, island, num_iterations, migrate_every, migrants,
+            inboxes[island], outboxes, reports)))
+
+    for process in processes:
+        process.start()
+
+    running = count
+    try:
+        while running > 0:
+            report = reports.get()
+            if report[0] == 'done':
+                running -= 1
+            elif report[0] == 'error':
+                raise RuntimeError("Island " + str(report[1]) + " failed:\n" + report[2])
+            else:
+                yield report[1:]
+    finally:
+        for process in processes:
+            if running > 0:
+                process.terminate()
+            process.join()
+
+
+def run_island(start, step, settings, island, num_iterations, migrate_every, migrants, inbox, outboxes, reports):
+    """
+    Evolves one island. Runs in the island's own process
+    """
+
+    try:
+        # every island needs its own random numbers
+        np.random.seed()
+        random.seed()
+
+        # migrants sent to a neighbour that has already finished are dropped, not waited on
+        for outbox in outboxes:
+            outbox.cancel_join_thread()
+
+        brains = start(island, settings)
+
+        for iteration in range(0, num_iterations):
+            if iteration > 0 and iteration % migrate_every == 0:
+                emigrate(brains, migrants, outboxes)
+                brains = immigrate(brains, inbox, iteration)
+
+            brains, columns = step(brains, iteration, island, settings)
+
+            reports.put(('report', island, iteration, brains.fitness, brains.names(), columns))
+
+    except Exception:
+        reports.put(('error', island, traceback.format_exc()))
+        return
+
+    reports.put(('done', island))
+
+
+def emigrate(brains, migrants, outboxes):
+    """
+    Sends copies of the fittest organisms to the neighbours
+    """
+
+    rows = selection.truncation(brains.fitness, min(migrants, len(brains)))
+    message = (brains.genomes[rows].tobytes(), brains.fitness[rows].tobytes())
+
+    for outbox in outboxes:
+        outbox.put(message)
+
+
+def immigrate(brains, inbox, iteration):
+    """
+    Takes in whatever migrants have arrived. They take the places of the least fit
+    :return: The new population
+    """
+
+    genomes = []
+    fitness = []
+    while True:
+        try:
+            genome_buffer, fitness_buffer = inbox.get_nowait()
+        except queue.Empty:
+            break
+
+        genomes.append(np.frombuffer(genome_buffer, dtype=brains.genomes.dtype).reshape(-1, brains.genomes.shape[1]))
+        fitness.append(np.frombuffer(fitness_buffer))
+
+    if not genomes:
+        return brains
+
+    size = min(sum(len(x) for x in genomes), len(brains))
+    keep = np.sort(np.argsort(brains.fitness, kind='stable')[size:])
+
+    brains = brains.select(keep)
+    brains.add_children(np.concatenate(genomes)[:size], np.concatenate(fitness)[:size], iteration)
+
+    return brains
+
+
+def coordinate(count, start, step, settings, num_iterations, points, migrate_every=MIGRATE_EVERY,
+               migrants=MIGRANTS, connect='ring'):
+    """
+    Runs the islands and writes their merged telemetry. Each organism gets a row in the
+    points, with its island as the last column. Like every points column it's written as a
+    float, so island 2 is 2.0. Once every island has finished a generation, its index
+    file lists all of their organisms as island(number)/(name)
+    :param points: The Telemetry to write to
+    :return: Nothing. See run for the rest of the parameters
+    """
+
+    generations = {}
+
+    for (island, iteration, fitness, names, columns) in run(count, start, step, settings, num_iterations,
+                                                            migrate_every, migrants, connect):
+        points.record(iteration, fitness, *columns, np.full(len(fitness), island))
+
+        reported = generations.setdefault(iteration, {})
+        reported[island] = (fitness, names)
+
+        if len(reported) == count:
+            print("Generation " + str(iteration + 1))
+            del generations[iteration]
+
+            points.index("generation" + str(iteration + 1) + "/index.csv",
+                         np.concatenate([reported[i][0] for i in range(0, count)]),
+                         ["island" + str(i) + "/" + name for i in range(0, count) for name in reported[i][1]])
@@ -0,0 +1,201 @@
+import neuralnet
+import classifier_fitness as cf
+import sys
+import os
+import getopt
+import json
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+
+# (topology, inputs, outputs). The ones from the unit tests, and a couple of big ones
+TOPOLOGIES = [([2, 2, 3, 3], 3, 3),
+              ([18], 31, 4),
+              ([13], 21, 5),
+              ([256, 256], 64, 10),
+              ([1024], 256, 10)]
+# how many rows the fitness benchmarks score
+DATASET_ROWS = 1000
+# how many nets the population fitness benchmark scores at once
+POPULATION = 100
+# how long to keep running each benchmark, in seconds. The best of REPEATS runs counts
+MIN_TIME = .2
+REPEATS = 3
+# how much slower than the baseline a benchmark can be before it's a regression
+TOLERANCE = .2
+
+
+def main(argv):
+    """
+    This program times the hot paths of neuralnet and classifier_fitness
+    """
+
+    # How the program is to be used
+    usage = "\tusage: --save=[baseline filename] --compare=[baseline filename]" \
+            " --tolerance=[fraction slower that counts as a regression] --filter=[part of a benchmark name]" \
+            " --dtype=[" + "|".join(neuralnet.DTYPES) + "]\n"
+
+    optlist, args = getopt.getopt(argv[1:], "h", ["help", "save=", "compare=", "tolerance=", "filter=",
+                                                  "dtype="])
+
+    # default parameters
+    save = ''
+    compare = ''
+    tolerance = TOLERANCE
+    name_filter = ''
+    dtype = "float64"
+
+    # replace the parameters
+    for key, val in optlist:
+        if key in ("-h", "--help"):
+            print(usage)
+            return 0
+        elif key == "--save":
+            save = val
+        elif key == "--compare":
+            compare = val
+        elif key == "--tolerance":
+            tolerance = float(val)
+        elif key == "--filter":
+            name_filter = val
+        elif key == "--dtype":
+            dtype = val
+
+    if dtype not in neuralnet.DTYPES:
+        print("Unknown dtype " + dtype + ". Use -h or --help for help")
+        return 1
+
+    baseline = {}
+    if compare != '':
+        with open(compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    fname = os.path.join(tempfile.gettempdir(), "netbenchmarks-" + str(os.getpid()) + ".net")
+
+    for (name, fn) in make_benchmarks(fname, neuralnet.DTYPES[dtype]):
+        if name_filter not in name:
+            continue
+
+        result = run_benchmark(fn)
+        results[name] = result
+
+        line = name.ljust(48) + ("%12.1f ops/sec" % result['ops_per_sec']) + \
+            ("%12d bytes/op" % result['bytes_per_op'])
+
+        # compare against the baseline
+        if name in baseline:
+            ratio = result['ops_per_sec'] / baseline[name]['ops_per_sec']
+            line += "  %5.2fx" % ratio
+            if ratio < 1 - tolerance:
+                line += "  REGRESSION"
+                regressions.append(name)
+
+        print(line)
+
+    if os.path.exists(fname):
+        os.remove(fname)
+
+    if save != '':
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if regressions:
+        print(str(len(regressions)) + " regression(s): " + ", ".join(regressions))
+        return 1
+
+    return 0
+
+
+def make_benchmarks(fname, dtype=np.float64):
+    """
+    Makes every benchmark
+    :param fname: The file the file benchmarks write to
+    :param dtype: The precision of the nets. Benchmarks of float32 nets have float32 in their names
+    :return: A list of (name, function). Each function does one operation
+    """
+
+    benchmarks = []
+
+    for (topology, num_inputs, num_outputs) in TOPOLOGIES:
+        suffix = " " + ",".join(str(x) for x in topology) + " " + str(num_inputs) + "->" + str(num_outputs)
+        if dtype != np.float64:
+            suffix += " " + np.dtype(dtype).name
+
+        net1 = neuralnet.FFNN(topology, num_inputs, num_outputs, dtype=dtype)
+        net2 = neuralnet.FFNN(topology, num_inputs, num_outputs, dtype=dtype)
+        inputs = np.random.random(num_inputs)
+        ds = make_dataset(num_inputs, num_outputs)
+        evaluator = cf.PopulationEvaluator(ds)
+        genomes = np.stack([neuralnet.make_net(topology, num_inputs, num_outputs, dtype)
+                            for i in range(0, POPULATION)])
+
+        benchmarks += [
+            ("get_outputs" + suffix, lambda net=net1, x=inputs: net.get_outputs(x)),
+            ("make_net" + suffix, lambda t=topology, i=num_inputs, o=num_outputs: neuralnet.make_net(t, i, o, dtype)),
+            ("mutate" + suffix, lambda net=net1: neuralnet.mutate(net)),
+            ("sp_crossover" + suffix, lambda a=net1, b=net2: neuralnet.sp_crossover(a, b)),
+            ("u_crossover" + suffix, lambda a=net1, b=net2: neuralnet.u_crossover(a, b)),
+            ("to_file/from_file" + suffix, lambda net=net1: file_round_trip(fname, net)),
+            ("get_fitness_ds" + suffix, lambda d=ds, net=net1: cf.get_fitness_ds(d, net)),
+            ("get_fitness_genomes x" + str(POPULATION) + suffix,
+             lambda e=evaluator, g=genomes, t=topology, i=num_inputs, o=num_outputs:
+             e.get_fitness_genomes(g, t, i, o))]
+
+    return benchmarks
+
+
+def make_dataset(num_inputs, num_outputs):
+    """
+    Makes a random data set to score nets on
+    """
+
+    data = np.random.random((DATASET_ROWS, num_inputs))
+    targets = np.random.randint(0, num_outputs, size=DATASET_ROWS)
+
+    return cf.Dataset(data, targets, np.arange(num_outputs).astype(str), 'benchmark')
+
+
+def file_round_trip(fname, net):
+    neuralnet.to_file(fname, net)
+    return neuralnet.from_file(fname)
+
+
+def run_benchmark(fn):
+    """
+    Times a function, and measures how much memory one call of it allocates
+    :param fn: The function. It's called with no arguments
+    :return: A dict with ops_per_sec, and bytes_per_op (the peak memory of one call)
+    """
+
+    # warm up, and find out how many calls take about MIN_TIME
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(0, calls):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_TIME:
+            break
+        calls *= 2 if elapsed == 0 else max(2, int(MIN_TIME / elapsed * 1.2))
+
+    best = elapsed
+    for repeat in range(1, REPEATS):
+        start = time.perf_counter()
+        for i in range(0, calls):
+            fn()
+        best = min(best, time.perf_counter() - start)
+
+    # tracemalloc slows everything down, so it's only on for one call
+    tracemalloc.start()
+    fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'ops_per_sec': calls / best, 'bytes_per_op': peak}
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,5 +1,15 @@
 import neuralnet
+import fitness_cache
+import classifier_fitness as cf
+import selection
+import telemetry
+import checkpoint
+import islands
+import profiling
+import queue
+from population import Population
 import sys
+import os
 import numpy as np
 
 
@@ -9,6 +19,22 @@ def main(argv):
     """
     test_net_sizes()
     test_net_outputs()
+    test_net_file()
+    test_net_outputs_batch()
+    test_net_outputs_population()
+    test_make_children()
+    test_archive()
+    test_fitness_cache()
+    test_selection()
+    test_population()
+    test_telemetry()
+    test_checkpoint()
+    test_timing_resume()
+    test_migration()
+    test_mini_batches()
+    test_race_pairs()
+    test_float32()
+    test_split()
 
 
 def test_net_sizes():
@@ -95,5 +121,438 @@ def test_net_outputs():
 
     np.testing.assert_array_equal(out1, out2, err_msg='Neural net outputs are not equal')
 
+
+def test_net_file():
+    """
+    Tests that a neural net written to a file reads back the same
+    """
+
+    net = neuralnet.FFNN([2, 2, 3, 3], 3, 3)
+    neuralnet.mutate(net)
+
+    for text in (False, True):
+        neuralnet.to_file("test.net", net, text=text)
+
+        read = neuralnet.from_file("test.net")
+        os.remove("test.net")
+
+        assert read.topology == net.topology, 'Topology changed: %(act)s, %(exp)s' \
+            % {'act': read.topology, 'exp': net.topology}
+
+        np.testing.assert_array_equal(read.weights, net.weights, err_msg='Weights changed')
+        np.testing.assert_array_equal(read.get_outputs([1, 2, 3]), net.get_outputs([1, 2, 3]),
+                                      err_msg='Neural net outputs are not equal')
+
+    # the read net should be usable like any other
+    neuralnet.mutate(read)
+
+
+def test_net_outputs_batch():
+    """
+    Tests that feeding many inputs at once gives the same outputs as one at a time
+    """
+
+    net = neuralnet.FFNN([18], 31, 4)
+
+    inputs = np.random.random((20, 31))
+    out = net.get_outputs_batch(inputs)
+
+    assert out.shape == (20, 4), 'Output shape != (20, 4). out.shape: %(shape)s' % {'shape': out.shape}
+
+    for (row, expected) in zip(inputs, out):
+        np.testing.assert_allclose(net.get_outputs(row), expected, err_msg='Batch outputs are not equal')
+
+
+def test_net_outputs_population():
+    """
+    Tests that feeding inputs to a stacked population gives the same outputs as each net alone
+    """
+
+    nets = [neuralnet.FFNN([2, 2, 3, 3], 3, 3) for i in range(0, 5)]
+    layers = neuralnet.split_layers(np.stack([x.weights for x in nets]), [2, 2, 3, 3], 3, 3)
+
+    inputs = np.random.random((10, 3))
+    out = neuralnet.get_outputs_population(layers, inputs)
+
+    assert out.shape == (5, 10, 3), 'Output shape != (5, 10, 3). out.shape: %(shape)s' % {'shape': out.shape}
+
+    for (net, expected) in zip(nets, out):
+        np.testing.assert_allclose(net.get_outputs_batch(inputs), expected,
+                                   err_msg='Population outputs are not equal')
+
+
+def test_make_children():
+    """
+    Tests that every weight of a child comes from one of its parents, and that
+    siblings are opposites of each other
+    """
+
+    genomes = np.stack([neuralnet.FFNN([18], 31, 4).weights for i in range(0, 4)])
+    parents = np.array([0, 1, 2, 2, 3, 0])
+
+    for uniform in (False, True):
+        children = neuralnet.make_children(genomes, parents, uniform=uniform)
+
+        assert children.shape == (6, 652), 'Children shape != (6, 652). children.shape: %(shape)s' \
+            % {'shape': children.shape}
+
+        for i in range(0, len(parents), 2):
+            mother, father = genomes[parents[i]], genomes[parents[i + 1]]
+            from_mother = children[i] == mother
+
+            assert np.all(from_mother | (children[i] == father)), 'Child has weights from neither parent'
+            np.testing.assert_array_equal(np.where(from_mother, father, mother), children[i + 1],
+                                          err_msg='Siblings are not opposites')
+
+
+def test_archive():
+    """
+    Tests that nets written to a population archive read back the same, by name
+    """
+
+    nets = [neuralnet.FFNN([13], 21, 5) for i in range(0, 6)]
+    names = ["1-" + str(i) + ".net" for i in range(0, 6)]
+    fitnesses = np.random.random(6)
+
+    neuralnet.to_archive("test.arc", nets, fitnesses, names)
+
+    archive = neuralnet.read_archive("test.arc")
+    np.testing.assert_array_equal(archive['fitness'], fitnesses, err_msg='Fitnesses changed')
+
+    for (net, name) in zip(nets, names):
+        read = neuralnet.from_file("test.arc", name)
+        np.testing.assert_array_equal(read.weights, net.weights, err_msg='Weights of ' + name + ' changed')
+
+    del archive
+    os.remove("test.arc")
+
+
+def test_fitness_cache():
+    """
+    Tests that the fitness cache finds clones, keeps running means and forgets old genomes
+    """
+
+    cache = fitness_cache.FitnessCache(max_size=2)
+    net1 = neuralnet.FFNN([5, 5], 4, 3)
+    net2 = neuralnet.FFNN([5, 5], 4, 3)
+
+    cache.put(net1.weights, .5, 'train')
+    assert cache.get(net1.weights.copy(), 'train') == .5, 'Clone was not found in the cache'
+    assert cache.get(net1.weights, 'test') is None, 'Fitness was found for the wrong data set'
+
+    cache.add(net2.weights, [1, 2])
+    assert cache.add(net2.weights, [6]) == 3, 'Running mean is wrong'
+    assert cache.samples(net2.weights) == 3, 'Sample count is wrong'
+
+    # the least recently used genome is forgotten
+    cache.put(neuralnet.FFNN([5, 5], 4, 3).weights, 0)
+    assert len(cache) == 2 and cache.get(net1.weights, 'train') is None, 'Cache did not evict'
+
+
+def test_selection():
+    """
+    Tests that every selection scheme picks valid indices, and never picks what can't be picked
+    """
+
+    fitness = np.array([0, .5, 0, .25, 1, 0])
+
+    for (name, scheme) in selection.SCHEMES.items():
+        picks = scheme(fitness, 20)
+        assert len(picks) == 20, name + ' picked ' + str(len(picks)) + ' instead of 20'
+        assert np.all((picks >= 0) & (picks < len(fitness))), name + ' picked an invalid index'
+
+    # nothing with no fitness is picked, unless nothing has any fitness
+    assert np.all(fitness[selection.roulette(fitness, 100)] > 0), 'Roulette picked a zero fitness'
+    assert np.all(fitness[selection.sus(fitness, 100)] > 0), 'SUS picked a zero fitness'
+    assert len(selection.roulette(np.zeros(4), 10)) == 10, 'Roulette failed with all zero fitness'
+
+    survivors = selection.roulette(fitness, 3, replace=False)
+    assert sorted(survivors) == [1, 3, 4], 'Roulette without replacement picked ' + str(survivors)
+    np.testing.assert_array_equal(selection.truncation(fitness, 2), [4, 1], err_msg='Truncation is wrong')
+
+
+def test_population():
+    """
+    Tests that selecting from and adding to a population keeps its arrays lined up
+    """
+
+    pop = Population.random(10, [18], 31, 4)
+    pop.fitness = np.arange(10) / 10.0
+
+    assert pop.genomes.shape == (10, 652), 'Genomes shape != (10, 652). pop.genomes.shape: %(shape)s' \
+        % {'shape': pop.genomes.shape}
+
+    survivors = pop.select(np.array([9, 3, 5]))
+    np.testing.assert_array_equal(survivors.genomes, pop.genomes[[9, 3, 5]], err_msg='Wrong genomes selected')
+    assert survivors.names() == ['0-9.net', '0-3.net', '0-5.net'], 'Wrong names: ' + str(survivors.names())
+
+    children = neuralnet.make_children(survivors.genomes, np.array([0, 1, 2, 2]))
+    survivors.add_children(children[[0, 2]], [.5, .6], 1, np.array([[0, 1], [2, 2]]))
+
+    assert len(survivors) == 5, 'Population size != 5. len(survivors): %(act)d' % {'act': len(survivors)}
+    assert survivors.names()[3:] == ['1-0.net', '1-1.net'], 'Wrong names: ' + str(survivors.names())
+    np.testing.assert_array_equal(survivors.parents[3:], [[9, 3], [5, 5]], err_msg='Wrong parents')
+    np.testing.assert_array_equal(survivors.net(4).weights, children[2], err_msg='Wrong net')
+
+
+def test_telemetry():
+    """
+    Tests that points written in the background come back the same from both formats
+    """
+
+    fname = 'test_points.csv'
+    points = telemetry.Telemetry(fname, 'both', flush_every=2)
+    for generation in range(0, 3):
+        points.record(generation, np.arange(4) + generation, [1.5, np.nan, 2.5, 3.5])
+    points.close()
+
+    with open(fname) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 12, 'CSV rows != 12. len(lines): %(act)d' % {'act': len(lines)}
+    assert lines[1] == '0,1.0,', 'Wrong CSV row: ' + lines[1]
+
+    numbers, values = telemetry.read_points('test_points.bin')
+    np.testing.assert_array_equal(numbers, np.repeat(np.arange(3), 4), err_msg='Wrong generations')
+    np.testing.assert_array_equal(values[0][4:8], np.arange(4) + 1, err_msg='Wrong first column')
+    assert np.isnan(values[1][5]), 'nan not kept in the binary file'
+
+    os.remove(fname)
+    os.remove('test_points.bin')
+
+    # a failed write is raised when the records are synced, and doesn't stop the rest
+    points = telemetry.Telemetry(fname)
+    points.index('no_such_directory/index.csv', [1.0], ['0-0.net'])
+    points.record(0, [1.0])
+    try:
+        points.sizes()
+        assert False, 'A failed write was not raised'
+    except FileNotFoundError:
+        pass
+    points.close()
+
+    with open(fname) as f:
+        assert f.read() == '0,1.0\n', 'Points after a failed write were lost'
+    os.remove(fname)
+
+
+def test_checkpoint():
+    """
+    Tests that a checkpoint puts back the random number generators, and that points
+    written after it are cut off when resuming
+    """
+
+    fname = 'test_checkpoint.pkl'
+    pop = Population.random(5, [3], 2, 2)
+
+    points = telemetry.Telemetry('test_points.csv')
+    points.record(0, pop.fitness)
+    checkpoint.save(fname, {'iteration': 0, 'brains': pop, 'points': points.sizes()})
+    expected = np.random.random(3)
+
+    # a generation that never made it into a checkpoint
+    points.record(1, pop.fitness)
+    points.close()
+
+    state = checkpoint.load(fname)
+    np.testing.assert_array_equal(np.random.random(3), expected, err_msg='RNG state not restored')
+    np.testing.assert_array_equal(state['brains'].genomes, pop.genomes, err_msg='Wrong genomes restored')
+
+    telemetry.Telemetry('test_points.csv', sizes=state['points']).close()
+    with open('test_points.csv') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 5, 'Rows after resuming != 5. len(lines): %(act)d' % {'act': len(lines)}
+
+    os.remove(fname)
+    os.remove('test_points.csv')
+
+
+def test_timing_resume():
+    """
+    Tests that resuming cuts the timing log back to the checkpoint's generation
+    """
+
+    fname = 'test_timing.csv'
+    timer = profiling.Timer(profiling.PSO_PHASES, fname)
+    for generation in range(0, 6):
+        timer.start_generation(generation)
+        timer.end_generation(generation)
+    timer.close()
+
+    timer = profiling.Timer(profiling.PSO_PHASES, fname, resume=3)
+    timer.start_generation(4)
+    timer.end_generation(4)
+    timer.close()
+
+    with open(fname) as f:
+        generations = [line.split(",")[0] for line in f.read().splitlines()]
+    assert generations == ['generation', '0', '1', '2', '3', '4'], 'Wrong timing rows: ' + ",".join(generations)
+
+    os.remove(fname)
+
+
+def test_migration():
+    """
+    Tests that migrants replace the least fit organisms of the island they move to
+    """
+
+    assert islands.neighbours(1, 4) == [2], 'Wrong ring neighbours: ' + str(islands.neighbours(1, 4))
+    assert islands.neighbours(1, 3, 'full') == [0, 2], 'Wrong neighbours: ' + str(islands.neighbours(1, 3, 'full'))
+
+    home = Population.random(5, [3], 2, 2)
+    home.fitness = np.array([.1, .9, .5, .8, .2])
+    away = Population.random(5, [3], 2, 2)
+    away.fitness = np.array([.3, .4, .6, .7, .35])
+
+    inbox = queue.Queue()
+    islands.emigrate(home, 2, [inbox])
+    away = islands.immigrate(away, inbox, 4)
+
+    np.testing.assert_array_equal(away.fitness, [.4, .6, .7, .9, .8], err_msg='Wrong fitness after migrating')
+    np.testing.assert_array_equal(away.genomes[3:], home.genomes[[1, 3]], err_msg='Wrong migrants')
+    assert away.names()[3:] == ['4-0.net', '4-1.net'], 'Wrong names: ' + str(away.names())
+
+    # nothing more has arrived
+    assert islands.immigrate(away, inbox, 5) is away, 'Population changed with no migrants'
+
+
+def test_mini_batches():
+    """
+    Tests that mini-batches keep each label's share of the rows, and grow to the whole set
+    """
+
+    targets = np.repeat([0, 1, 2], [500, 300, 200])
+    rows = cf.stratified_rows(targets, 100)
+
+    assert len(np.unique(rows)) == 100, 'Rows picked != 100. len(rows): %(act)d' % {'act': len(np.unique(rows))}
+    np.testing.assert_array_equal(np.bincount(targets[rows]), [50, 30, 20], err_msg='Labels not stratified')
+
+    ds = cf.Dataset(np.random.random((1000, 3)), targets, np.array(['a', 'b', 'c']), 'test')
+    evaluator = cf.MiniBatchEvaluator(ds, 100, growth=4)
+    first_name = evaluator.ds.name
+
+    evaluator.resample()
+    assert len(evaluator.ds) == 400, 'Batch size != 400. len(evaluator.ds): %(act)d' % {'act': len(evaluator.ds)}
+    assert evaluator.ds.name != first_name, 'Subsets share a name: ' + first_name
+
+    evaluator.resample()
+    assert evaluator.complete() and evaluator.ds is ds, 'Batch did not grow to the whole set'
+
+
+def test_race_pairs():
+    """
+    Tests that racing siblings picks the same winners, with the same scores, as fully
+    scoring them
+    """
+
+    ds = cf.Dataset(np.random.random((1000, 3)), np.random.randint(0, 2, size=1000), np.array(['a', 'b']), 'test')
+    evaluator = cf.PopulationEvaluator(ds)
+
+    genomes = np.stack([neuralnet.make_net([4], 3, 2) for i in range(0, 40)])
+    genomes[5] = genomes[4]
+    scores = evaluator.get_fitness_genomes(genomes, [4], 3, 2)
+    expected = np.arange(0, 40, 2) + (scores[0::2] <= scores[1::2])
+
+    known = np.full(40, np.nan)
+    known[::3] = scores[::3]
+    best, best_scores = evaluator.race_pairs(genomes, [4], 3, 2, known, chunk_rows=64)
+
+    np.testing.assert_array_equal(best, expected, err_msg='Wrong winners')
+    np.testing.assert_array_equal(best_scores, scores[expected], err_msg='Wrong winning scores')
+
+    # every score already known, like siblings that were all in the cache
+    best, best_scores = evaluator.race_pairs(genomes, [4], 3, 2, scores)
+    np.testing.assert_array_equal(best, expected, err_msg='Wrong winners when every score was known')
+    np.testing.assert_array_equal(best_scores, scores[expected],
+                                  err_msg='Wrong winning scores when every score was known')
+
+
+def test_float32():
+    """
+    Tests that float32 nets stay float32 through the operators and files, and score
+    close to the same nets in float64
+    """
+
+    ds = cf.Dataset(np.random.random((1000, 21)), np.random.randint(0, 5, size=1000), np.arange(5).astype(str),
+                    'test')
+    evaluator = cf.PopulationEvaluator(ds)
+
+    genomes = np.stack([neuralnet.make_net([13], 21, 5) for i in range(0, 20)])
+    genomes32 = genomes.astype(np.float32)
+
+    net = neuralnet.FFNN([13], 21, 5, genomes[0])
+    net32 = neuralnet.FFNN([13], 21, 5, genomes32[0])
+    outputs = net32.get_outputs_batch(ds.data)
+    assert outputs.dtype == np.float32, 'float32 net gave %s outputs' % outputs.dtype
+    error = np.max(np.abs(outputs - net.get_outputs_batch(ds.data)))
+    assert error < 1e-4, 'float32 outputs are off by %f' % error
+
+    # only rows where the two best outputs are about tied can go the other way
+    scores = evaluator.get_fitness_genomes(genomes, [13], 21, 5)
+    scores32 = evaluator.get_fitness_genomes(genomes32, [13], 21, 5)
+    outputs = np.sort(neuralnet.get_outputs_population(neuralnet.split_layers(genomes, [13], 21, 5), ds.data))
+    ties = np.count_nonzero(outputs[:, :, -1] - outputs[:, :, -2] < 1e-4, axis=1) / len(ds)
+    error = np.abs(scores32 - scores) - ties
+    assert np.all(error <= 1e-9), 'float32 fitness is off by %f more than the ties' % np.max(error)
+
+    children = neuralnet.make_children(genomes32, np.arange(20))
+    neuralnet.mutate_genome(children)
+    assert children.dtype == np.float32, 'Children are %s' % children.dtype
+
+    neuralnet.to_file("test.net", net32)
+    read = neuralnet.from_file("test.net")
+    assert read.weights.dtype == np.float32, 'Read a float32 net back as %s' % read.weights.dtype
+    np.testing.assert_array_equal(read.weights, net32.weights, err_msg='float32 weights changed')
+
+    neuralnet.to_archive_genomes("test.arc", genomes32, scores32, [str(i) for i in range(0, 20)], [13], 21, 5)
+    archive = neuralnet.read_archive("test.arc")
+    np.testing.assert_array_equal(archive['weights'], genomes32, err_msg='float32 archive changed')
+
+    del archive
+    os.remove("test.net")
+    os.remove("test.arc")
+
+
+def test_split():
+    """
+    Tests that splitting a data set puts every row in one set, the same way however it's
+    chunked, and that the sets load the same as parsing their csvs
+    """
+
+    data = np.round(np.random.random((1000, 3)), 4)
+    labels = np.random.choice(['a', 'b', 'c'], size=1000)
+    with open("test.csv", "w") as f:
+        f.write("".join(",".join(str(x) for x in row) + "," + label + "\n" for (row, label) in zip(data, labels)))
+
+    split = []
+    for chunk_rows in (1000, 64):
+        training_fname, testing_fname = cf.make_te_tr_sets("test.csv", chunk_rows=chunk_rows)
+        assert training_fname == "test.csv.tr", 'The training set came back as %s' % training_fname
+
+        sets = [np.genfromtxt(x, delimiter=",", dtype=str) for x in (training_fname, testing_fname)]
+        split.append(sets)
+        for fname in (training_fname, testing_fname):
+            for shard in [fname] + cf.shard_fnames(fname):
+                os.remove(shard)
+
+    np.testing.assert_array_equal(split[0][0], split[1][0], err_msg='Chunking changed the training set')
+    assert len(split[0][0]) + len(split[0][1]) == 1000, 'The split lost or added rows'
+    assert 600 < len(split[0][0]) < 800, 'The training set has %d of 1000 rows' % len(split[0][0])
+
+    # the shards of the last split load the same as the csv
+    cf.make_te_tr_sets("test.csv", chunk_rows=64)
+    ds = cf.load_dataset("test.csv.tr")
+    expected = cf.Dataset.from_csv(split[1][0])
+    assert isinstance(ds.data, np.memmap), 'The training set was not memory mapped'
+    np.testing.assert_array_equal(ds.data, expected.data, err_msg='The training data changed')
+    np.testing.assert_array_equal(ds.targets, expected.targets, err_msg='The training targets changed')
+
+    del ds
+    cf.dataset_cache.clear()
+    for fname in ("test.csv.tr", "test.csv.te"):
+        for shard in [fname] + cf.shard_fnames(fname):
+            os.remove(shard)
+    os.remove("test.csv")
+
+
 if __name__ == "__main__":
     main(sys.argv)
@@ -1,21 +1,64 @@
 """
-A neural net is just a list of lists of lists. (layers, nodes, weights).
+A neural net is a list of layers. Each layer is a 2-dimensional array of weights
+(nodes, inputs + 1), with the bias weight in the last column. All the layers of a
+net are views into one flat, contiguous weight vector, so a net can be treated as
+either a list of layers or a single genome.
 So this file is just a collection of functions that are useful for manipulating
 that type of a structure.
 """
 
+import os
 import random
 import numpy as np
 
+# binary net files start with this, so they can be told apart from text ones
+MAGIC = b'FFNN'
+# and population archives start with this
+ARCHIVE_MAGIC = b'FFNA'
+# files of float32 weights start with these instead
+MAGIC_32 = b'FFN4'
+ARCHIVE_MAGIC_32 = b'FFA4'
+# how the weights are stored, by what the file starts with
+WEIGHT_FORMATS = {MAGIC: '<f8', MAGIC_32: '<f4', ARCHIVE_MAGIC: '<f8', ARCHIVE_MAGIC_32: '<f4'}
+# the precisions nets can have
+DTYPES = {'float64': np.float64, 'float32': np.float32}
+
 
 class FFNN:
     """ A multi-layer feed-forward neural net """
 
-    def __init__(self, topology, num_inputs, num_outputs):
+    def __init__(self, topology, num_inputs, num_outputs, weights=None, dtype=None):
+        """
+        :param weights: A flat array of weights. The net uses it as is, without copying it.
+        If it is not given, the net starts with random weights
+        :param dtype: np.float64 or np.float32. By default, float32 weights stay float32
+        and anything else is float64
+        """
         self.topology = topology
         self.num_inputs = num_inputs
         self.num_outputs = num_outputs
-        self.layers = make_net(topology, num_inputs, num_outputs)
+
+        if dtype is None:
+            dtype = weights_dtype(weights)
+
+        if weights is None:
+            weights = make_net(topology, num_inputs, num_outputs, dtype)
+        else:
+            weights = np.asarray(weights, dtype=dtype).ravel()
+            assert len(weights) == num_weights(topology, num_inputs, num_outputs)
+
+        self.weights = weights
+        self.layers = split_layers(weights, topology, num_inputs, num_outputs)
+
+    def __getstate__(self):
+        # the layers are views into the weights, so they are rebuilt rather than copied
+        state = self.__dict__.copy()
+        del state['layers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.layers = split_layers(self.weights, self.topology, self.num_inputs, self.num_outputs)
 
     def get_outputs(self, inputs):
         """
@@ -24,65 +67,100 @@ class FFNN:
         :return: A 1-dimensional array of numbers that the net outputs
         """
 
-        # first layer
-        out = get_outputs(self.layers[0], inputs)
+        out = np.asarray(inputs, dtype=self.weights.dtype)
 
-        for i in range(1, len(self.layers)):
-            out = get_outputs(self.layers[i], out)
+        for layer in self.layers:
+            out = get_outputs(layer, out)
 
         return out
 
+    def get_outputs_batch(self, inputs):
+        """
+        Get the outputs of a neural network for many inputs at once
+        :param inputs: A 2-dimensional array of numbers (N, num_inputs). One row per input
+        :return: A 2-dimensional array of numbers (N, num_outputs). One row per input
+        """
+
+        out = np.asarray(inputs, dtype=self.weights.dtype)
+
+        for layer in self.layers:
+            out = get_outputs_batch(layer, out)
 
-def make_net(topology, num_inputs, num_outputs):
+        return out
+
+
+def weights_dtype(weights):
     """
-    Makes a neural net (list of lists of lists) that is the desired size, and fills
-    it with random values
+    Gets the precision to keep some weights in. float32 weights stay float32, and
+    anything else is float64
     """
 
-    # input layer
-    layers = [make_layer(num_inputs, topology[0])]
+    return np.float32 if getattr(weights, 'dtype', None) == np.float32 else np.float64
 
-    # hidden layers
-    for i in range(1, len(topology)):
-        layers.append(make_layer(len(layers[i - 1]), topology[i]))
 
-    # output layer
-    layers.append(make_layer(len(layers[-1]), num_outputs))
+def layer_shapes(topology, num_inputs, num_outputs):
+    """
+    Gets the shape of every layer in a neural net
+    :return: A list of (nodes, inputs + 1) tuples, one per layer
+    """
 
-    return layers
+    sizes = [num_inputs] + list(topology) + [num_outputs]
+
+    # +1 for the bias
+    return [(sizes[i + 1], sizes[i] + 1) for i in range(0, len(sizes) - 1)]
 
 
-def make_layer(num_inputs, num_nodes):
+def num_weights(topology, num_inputs, num_outputs):
     """
-    Makes a layer of nodes in a neural net
+    Gets the total number of weights in a neural net
     """
 
-    layer = []
+    return sum(nodes * inputs for (nodes, inputs) in layer_shapes(topology, num_inputs, num_outputs))
+
 
-    for i in range(0, num_nodes):
-        layer.append(make_node(num_inputs))
+def split_layers(weights, topology, num_inputs, num_outputs):
+    """
+    Splits a flat weight vector into its layers. The layers are views, so writing
+    to them writes to the weight vector
+    :param weights: A flat weight vector, or a 2-dimensional array with one weight
+    vector per row
+    :return: A list of 2-dimensional arrays (nodes, inputs + 1), or of 3-dimensional
+    arrays (rows, nodes, inputs + 1) if there was one weight vector per row
+    """
 
-    return layer
+    layers = []
+    offset = 0
 
+    for (nodes, inputs) in layer_shapes(topology, num_inputs, num_outputs):
+        layer = weights[..., offset:offset + nodes * inputs]
+        layers.append(layer.reshape(weights.shape[:-1] + (nodes, inputs)))
+        offset += nodes * inputs
 
-def make_node(num_inputs):
+    return layers
+
+
+def make_net(topology, num_inputs, num_outputs, dtype=np.float64):
     """
-    Makes a node in a neural network
+    Makes the weights of a neural net that is the desired size, and fills
+    it with random values
+    :param dtype: np.float64 or np.float32
+    :return: A flat array of weights. Use split_layers to see it as layers
     """
 
-    node = []
+    return random_weights(num_weights(topology, num_inputs, num_outputs), dtype)
 
-    # +1 for the bias
-    for i in range(0, num_inputs + 1):
-        weight = np.random.exponential()
 
-        # 50% chance to be negative
-        if random.randint(0, 1) == 0:
-            weight *= -1
+def random_weights(size, dtype=np.float64):
+    """
+    Makes an array of random weights. Each one is exponentially distributed,
+    with a 50% chance to be negative. They are drawn the same way whatever the dtype,
+    so a seeded float32 run starts from the rounded weights of a float64 one
+    """
 
-        node.append(weight)
+    weights = np.random.exponential(size=size)
+    weights[np.random.randint(0, 2, size=size) == 0] *= -1
 
-    return node
+    return weights.astype(dtype, copy=False)
 
 
 def sp_crossover(net1, net2):
@@ -96,29 +174,11 @@ def sp_crossover(net1, net2):
     :return: two offspring, each the opposite of the other
     """
 
-    total = 0
-    for layer in net1.layers:
-        for node in layer:
-            total += len(node)
+    weights1, weights2 = sp_crossover_genomes(net1.weights, net2.weights)
 
     # the babies that will be returned
-    child1 = FFNN(net1.topology, net1.num_inputs, net1.num_outputs)
-    child2 = FFNN(net1.topology, net1.num_inputs, net1.num_outputs)
-
-    split = random.randint(1, total - 1)
-
-    index = 0
-    for i in range(0, len(net1.layers)):
-        for j in range(0, len(net1.layers[i])):
-            for k in range(0, len(net1.layers[i][j])):
-                if index < split:
-                    child1.layers[i][j][k] = net1.layers[i][j][k]
-                    child2.layers[i][j][k] = net2.layers[i][j][k]
-                else:
-                    child2.layers[i][j][k] = net1.layers[i][j][k]
-                    child1.layers[i][j][k] = net2.layers[i][j][k]
-
-                index += 1
+    child1 = FFNN(net1.topology, net1.num_inputs, net1.num_outputs, weights1)
+    child2 = FFNN(net1.topology, net1.num_inputs, net1.num_outputs, weights2)
 
     return child1, child2
 
@@ -132,62 +192,161 @@ def u_crossover(net1, net2):
     :return: two offspring, each the opposite of the other
     """
 
-    child1 = FFNN(net1.topology, net1.num_inputs, net1.num_outputs)
-    child2 = FFNN(net1.topology, net1.num_inputs, net1.num_outputs)
+    weights1, weights2 = u_crossover_genomes(net1.weights, net2.weights)
+
+    child1 = FFNN(net1.topology, net1.num_inputs, net1.num_outputs, weights1)
+    child2 = FFNN(net1.topology, net1.num_inputs, net1.num_outputs, weights2)
+
+    return child1, child2
+
+
+def sp_crossover_genomes(genome1, genome2):
+    """
+    Single Point Crossover on flat weight vectors
+    :param genome1: The weights of the first parent
+    :param genome2: The weights of the second parent
+    :return: two offspring weight vectors, each the opposite of the other
+    """
+
+    split = random.randint(1, len(genome1) - 1)
 
-    for i in range(0, len(net1.layers)):
-        for j in range(0, len(net1.layers[i])):
-            for k in range(0, len(net1.layers[i][j])):
-                if random.randint(0, 1) == 0:
-                    child1.layers[i][j][k] = net1.layers[i][j][k]
-                    child2.layers[i][j][k] = net2.layers[i][j][k]
-                else:
-                    child2.layers[i][j][k] = net1.layers[i][j][k]
-                    child1.layers[i][j][k] = net2.layers[i][j][k]
+    child1 = np.concatenate((genome1[:split], genome2[split:]))
+    child2 = np.concatenate((genome2[:split], genome1[split:]))
 
     return child1, child2
 
 
-def to_file(filename, net):
+def u_crossover_genomes(genome1, genome2):
     """
-    Write a neural net to a file
+    Uniform Crossover on flat weight vectors
+    :param genome1: The weights of the first parent
+    :param genome2: The weights of the second parent
+    :return: two offspring weight vectors, each the opposite of the other
+    """
+
+    mask = np.random.randint(0, 2, size=len(genome1)) == 0
+
+    child1 = np.where(mask, genome1, genome2)
+    child2 = np.where(mask, genome2, genome1)
+
+    return child1, child2
+
+
+def make_children(genomes, parents, uniform=False):
+    """
+    Makes all the children of a generation at once
+    :param genomes: A 2-dimensional array of weights (organisms, n_weights)
+    :param parents: A 1-dimensional array of row indices into genomes. Each consecutive
+    pair of indices is a couple that produces two children
+    :param uniform: Use uniform crossover instead of single point crossover
+    :return: A 2-dimensional array of weights (children, n_weights), with the same dtype
+    as genomes. The children of parents[2i] and parents[2i + 1] are rows 2i and 2i + 1
+    """
+
+    mothers = genomes[parents[0::2]]
+    fathers = genomes[parents[1::2]]
+    num_couples, total = mothers.shape
+
+    if uniform:
+        mask = np.random.randint(0, 2, size=(num_couples, total)) == 0
+    else:
+        # one split point per couple. Each child takes the first parent's DNA before it
+        splits = np.random.randint(1, total, size=(num_couples, 1))
+        mask = np.arange(total) < splits
+
+    children = np.empty((2 * num_couples, total), dtype=genomes.dtype)
+    np.copyto(children[0::2], np.where(mask, mothers, fathers))
+    np.copyto(children[1::2], np.where(mask, fathers, mothers))
+
+    return children
+
+
+def to_file(filename, net, text=False):
+    """
+    Write a neural net to a file. The binary format is a header of little-endian int32s
+    (num inputs, num outputs, num hidden layers, topology), padded to 8 bytes, followed
+    by the raw little-endian float64 weights. Float32 nets are written as float32, and
+    their files start with MAGIC_32 instead of MAGIC
+    :param text: Write the old space separated text format instead
     """
     if type(net) != FFNN:
         raise TypeError('Cannot write an object that is not a FFNN to a file')
 
-    file = open(filename, "w")
-    file.truncate()
+    # num inputs, num outputs, num hidden layers, topology
+    header = [net.num_inputs, net.num_outputs, len(net.layers) - 1] + list(net.topology)
+
+    if text:
+        contents = " ".join(str(x) for x in header + net.weights.tolist())
+
+        with open(filename, "w") as file:
+            file.write(contents)
+        return
+
+    magic = MAGIC_32 if net.weights.dtype == np.float32 else MAGIC
+    weight_format = np.dtype(WEIGHT_FORMATS[magic])
 
-    # num inputs, num outputs, num hidden layers
-    contents = str(net.num_inputs) + " " + str(net.num_outputs) + " " + str(len(net.layers) - 1)
+    # lay the whole file out in one buffer, and write it all at once
+    weights_offset = header_size(len(net.topology))
+    contents = bytearray(weights_offset + weight_format.itemsize * len(net.weights))
 
-    # topology
-    for i in net.topology:
-        contents += " " + str(i)
+    contents[:len(magic)] = magic
+    np.frombuffer(contents, dtype='<i4', count=len(header), offset=len(magic))[:] = header
+    np.frombuffer(contents, dtype=weight_format, offset=weights_offset)[:] = net.weights
 
-    # weights
-    for i in range(0, len(net.layers)):
-        for j in range(0, len(net.layers[i])):
-            for weight in net.layers[i][j]:
-                contents += " " + str(weight)
+    with open(filename, "wb") as file:
+        file.write(contents)
 
-    file.write(contents)
-    file.close()
 
+def from_file(filename, name=None):
+    """
+    Read a neural net from a file. Binary and text files are both understood
+    :param name: If given, the file is a population archive, and the net with this name
+    is read out of it. Only that net's weights are read from disk
+    :return: The neural net that was read
+    """
+
+    if name is not None:
+        archive = read_archive(filename)
+        matches = np.flatnonzero(archive['names'] == name.encode())
+        if len(matches) == 0:
+            raise KeyError('No net named ' + name + ' in ' + filename)
+
+        weights = np.array(archive['weights'][matches[0]])
+
+        return FFNN(archive['topology'], archive['num_inputs'], archive['num_outputs'], weights)
+
+    # read the whole file straight into one buffer
+    contents = bytearray(os.path.getsize(filename))
+    with open(filename, "rb") as file:
+        file.readinto(contents)
+
+    magic = bytes(contents[:len(MAGIC)])
+    if magic not in (MAGIC, MAGIC_32):
+        return from_text(contents)
 
-def from_file(filename):
+    num_inputs, num_outputs, num_hidden = np.frombuffer(contents, dtype='<i4', count=3, offset=len(MAGIC))
+    topology = np.frombuffer(contents, dtype='<i4', count=num_hidden, offset=len(MAGIC) + 12).tolist()
+    assert(len(topology) > 0)
+
+    # the net's weights are the file's buffer, not a copy of it
+    weights = np.frombuffer(contents, dtype=WEIGHT_FORMATS[magic], offset=header_size(num_hidden))
+
+    return FFNN(topology, int(num_inputs), int(num_outputs), weights)
+
+
+def from_text(contents):
     """
-    Read a neural net from a file
+    Read a neural net from the contents of a text file
     :return: The neural net that was read
     """
 
     # ['4', '3', '1', '4', '-0.8267162400009331', ... ]
-    l = list(np.genfromtxt(filename, dtype=str, delimiter=' '))
+    l = contents.decode().split()
     assert(len(l) > 4)
 
     num_inputs = int(l[0])
     num_outputs = int(l[1])
-    i_read = 2
+    i_read = 3
 
     topology = []
     for i in range(0, int(l[2])):
@@ -195,35 +354,104 @@ def from_file(filename):
         i_read += 1
     assert(len(topology) > 0)
 
-    # input layer
-    net = FFNN(topology, num_inputs, num_outputs)
-    input_layer = []
+    weights = np.array(l[i_read:], dtype=float)
+
+    return FFNN(topology, num_inputs, num_outputs, weights)
+
+
+def header_size(num_hidden):
+    """
+    Gets the size in bytes of a binary net file's header, so the weights after it are aligned
+    """
+
+    return align(len(MAGIC) + 4 * (3 + num_hidden))
+
+
+def align(size):
+    """
+    Pads a size in bytes up to a multiple of 8
+    """
+
+    return size + (-size % 8)
+
+
+def to_archive(filename, nets, fitnesses, names):
+    """
+    Write a whole population of same-topology neural nets to one file. After a header
+    like a binary net file's (with the population size and name width added), the file
+    holds the names, the fitnesses, and then a (population, n_weights) matrix of
+    little-endian float64 weights, each block padded to 8 bytes. Float32 populations are
+    written as float32, and their archives start with ARCHIVE_MAGIC_32 instead
+    :param nets: A list of neural net objects
+    :param fitnesses: The fitness of each net
+    :param names: The name of each net
+    """
+
+    net = nets[0]
+    genomes = np.stack([x.weights for x in nets])
+
+    to_archive_genomes(filename, genomes, fitnesses, names, net.topology, net.num_inputs, net.num_outputs)
+
+
+def to_archive_genomes(filename, genomes, fitnesses, names, topology, num_inputs, num_outputs):
+    """
+    Write a whole population of same-topology neural nets to one file, like to_archive
+    :param genomes: A 2-dimensional array of weights (nets, n_weights)
+    """
+
+    magic = ARCHIVE_MAGIC_32 if weights_dtype(genomes) == np.float32 else ARCHIVE_MAGIC
+    names = np.array(names, dtype='S')
+    weights = np.ascontiguousarray(genomes, dtype=WEIGHT_FORMATS[magic])
+
+    # num inputs, num outputs, num hidden layers, topology, population, name width
+    header = [num_inputs, num_outputs, len(topology)] + list(topology) + [len(weights), names.itemsize]
+
+    # everything but the weights goes in one buffer
+    names_offset = align(len(ARCHIVE_MAGIC) + 4 * len(header))
+    fitness_offset = names_offset + align(names.nbytes)
+    contents = bytearray(fitness_offset + 8 * len(weights))
+
+    contents[:len(magic)] = magic
+    np.frombuffer(contents, dtype='<i4', count=len(header), offset=len(ARCHIVE_MAGIC))[:] = header
+    contents[names_offset:names_offset + names.nbytes] = names.tobytes()
+    np.frombuffer(contents, dtype='<f8', offset=fitness_offset)[:] = fitnesses
+
+    with open(filename, "wb") as file:
+        file.write(contents)
+        weights.tofile(file)
 
-    for i in range(0, topology[0]):
 
-        node = []
-        for j in range(0, num_inputs + 1):
-            node.append(float(l[i_read]))
-            i_read += 1
+def read_archive(filename):
+    """
+    Read a population archive. The weights are memory mapped, so they are only read
+    from disk when they are used
+    :return: A dict with the topology, num_inputs, num_outputs, names, fitness
+    and a (population, n_weights) matrix of weights, float64 or float32
+    """
 
-        input_layer.append(node)
+    with open(filename, "rb") as file:
+        magic = file.read(len(ARCHIVE_MAGIC))
+        if magic not in (ARCHIVE_MAGIC, ARCHIVE_MAGIC_32):
+            raise ValueError(filename + ' is not a population archive')
 
-    net.layers[0] = input_layer
+        num_inputs, num_outputs, num_hidden = np.fromfile(file, dtype='<i4', count=3)
+        header = np.fromfile(file, dtype='<i4', count=num_hidden + 2)
+        topology = header[:num_hidden].tolist()
+        population, name_width = int(header[-2]), int(header[-1])
 
-    # hidden layers
-    for i in range(1, len(topology)):
+        names_offset = align(len(ARCHIVE_MAGIC) + 4 * (5 + num_hidden))
+        file.seek(names_offset)
+        names = np.fromfile(file, dtype='S' + str(name_width), count=population)
 
-        layer = []
-        for j in range(0, topology[i]):
+        fitness_offset = names_offset + align(population * name_width)
+        file.seek(fitness_offset)
+        fitness = np.fromfile(file, dtype='<f8', count=population)
 
-            node = []
-            for k in range(0, len(net.layers[i - 1])):
-                node.append(float(l[i_read]))
-                i_read += 1
-            layer.append(node)
-        net.layers[i] = layer
+    weights = np.memmap(filename, dtype=WEIGHT_FORMATS[magic], mode='r', offset=fitness_offset + 8 * population,
+                        shape=(population, num_weights(topology, num_inputs, num_outputs)))
 
-    return net
+    return {'topology': topology, 'num_inputs': int(num_inputs), 'num_outputs': int(num_outputs),
+            'names': names, 'fitness': fitness, 'weights': weights}
 
 
 def mutate(net):
@@ -233,35 +461,33 @@ def mutate(net):
     """
 
     if type(net) == FFNN:
-        network = net.layers
+        network = [net.weights]
     elif type(net) == list:
         network = net
     else:
         raise TypeError('Net is not a FFNN or list')
 
+    for layer in network:
+        mutate_genome(layer)
+
+
+def mutate_genome(genome):
+    """
+    Mutates an array of weights in place. It can be one net's weights or a whole
+    generation's (organisms, n_weights) matrix
+    """
+
     # The chance for each weight to change is 1 / L where L is
     #   the number of weights in the network
-    #L = 0
-    #for i in range(0, len(network)):
-    #    for j in range(0, len(network[i])):
-    #        L += len(network[i][j])
+    #L = genome.shape[-1]
     L = 10
 
-    for i in range(0, len(network)):
-        for j in range(0, len(network[i])):
-            for k in range(0, len(network[i][j])):
-
-                coin = random.randint(0, L)
-                if coin == 1:
-                    # -5 <= r <= 5
-                    #r = (random.random() - .5) * 5.0
-                    r = np.random.exponential()
+    coins = np.random.randint(0, L + 1, size=genome.shape)
+    hits = coins == 1
 
-                    # 50% chance to be negative
-                    if random.randint(0, 1) == 0:
-                        r *= -1
-
-                    network[i][j][k] += r
+    # -5 <= r <= 5
+    #r = (np.random.random(size=np.count_nonzero(hits)) - .5) * 5.0
+    genome[hits] += random_weights(np.count_nonzero(hits), genome.dtype)
 
 
 def get_outputs(layer, inputs):
@@ -272,21 +498,46 @@ def get_outputs(layer, inputs):
     :return: The output of the layer
     """
 
-    outputs = []
+    # there should be 1 extra input for the bias
+    assert layer.shape[1] == len(inputs) + 1
 
-    for node in layer:
-        # there should be 1 extra input for the bias
-        assert len(node) == len(inputs) + 1
+    # the bias input is always -1
+    return np.tanh(layer[:, :-1] @ inputs - layer[:, -1])
+
+
+def get_outputs_batch(layer, inputs):
+    """
+    A helper function that gets the outputs of a layer in a neural net for many inputs
+    :param layer: A 2-dimensional array of numbers ( layer = [node = [ weights ] ])
+    :param inputs: A 2-dimensional array of numbers. One row of inputs to the layer per input
+    :return: The outputs of the layer. One row per input
+    """
+
+    # there should be 1 extra input for the bias
+    assert layer.shape[1] == inputs.shape[1] + 1
 
-        total = 0
-        for i in range(0, len(node) - 1):
-            total += node[i] * float(inputs[i])
+    # the bias input is always -1
+    return np.tanh(inputs @ layer[:, :-1].T - layer[:, -1])
+
+
+def get_outputs_population(layers, inputs):
+    """
+    Gets the outputs of a whole population of same-topology neural nets for many inputs
+    :param layers: A list of 3-dimensional arrays of numbers ( layer = [net = [node = [ weights ] ]])
+    :param inputs: A 2-dimensional array of numbers (N, num_inputs). One row per input
+    :return: A 3-dimensional array of numbers (nets, N, num_outputs)
+    """
+
+    out = inputs
+
+    for layer in layers:
+        # there should be 1 extra input for the bias
+        assert layer.shape[2] == out.shape[-1] + 1
 
-        # bias
-        total += node[-1] * -1
-        outputs.append(np.tanh(total))
+        # (N, inputs) or (nets, N, inputs) against (nets, inputs, nodes). The bias input is always -1
+        out = np.tanh(np.matmul(out, layer[:, :, :-1].transpose(0, 2, 1)) - layer[:, None, :, -1])
 
-    return outputs
+    return out
 
 
 def zero_out(net: FFNN):
@@ -295,7 +546,4 @@ def zero_out(net: FFNN):
     :param net: The neural net to zero out
     """
 
-    for i in range(0, len(net.layers)):
-        for j in range(0, len(net.layers[i])):
-            for k in range(0, len(net.layers[i][j])):
-                net.layers[i][j][k] = 0
+    net.weights[:] = 0
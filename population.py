@@ -0,0 +1,115 @@
+"""
+A population of same-topology neural nets, stored as arrays rather than one object per
+organism. Row i of every array belongs to organism i, so selection is just indexing.
+"""
+
+import neuralnet
+import numpy as np
+
+
+class Population:
+    """ The genomes, fitness and lineage of a population of nets """
+
+    def __init__(self, genomes, topology, num_inputs, num_outputs, fitness=None,
+                 generations=None, numbers=None, parents=None, ids=None):
+        """
+        :param genomes: A 2-dimensional array of weights (organisms, n_weights)
+        :param fitness: The fitness of each organism. nan if it hasn't been scored
+        :param generations: The generation each organism was born in
+        :param numbers: The number of each organism within its generation
+        :param parents: A 2-dimensional array (organisms, 2) of the ids of each organism's
+        parents. -1 if it has none
+        :param ids: An id for each organism, unique within the run
+        """
+
+        size = len(genomes)
+
+        self.genomes = genomes
+        self.topology = topology
+        self.num_inputs = num_inputs
+        self.num_outputs = num_outputs
+        self.fitness = np.full(size, np.nan) if fitness is None else np.asarray(fitness, dtype=float)
+        self.generations = np.zeros(size, dtype=np.int32) if generations is None else np.asarray(generations)
+        self.numbers = np.arange(size, dtype=np.int32) if numbers is None else np.asarray(numbers)
+        self.parents = np.full((size, 2), -1, dtype=np.int64) if parents is None else np.asarray(parents)
+        self.ids = np.arange(size, dtype=np.int64) if ids is None else np.asarray(ids)
+
+    @classmethod
+    def random(cls, size, topology, num_inputs, num_outputs, dtype=np.float64):
+        """
+        Makes a population of random nets, all in generation 0
+        :param dtype: The precision of the genomes. np.float64 or np.float32
+        """
+
+        genomes = np.empty((size, neuralnet.num_weights(topology, num_inputs, num_outputs)), dtype=dtype)
+        for i in range(0, size):
+            genomes[i] = neuralnet.make_net(topology, num_inputs, num_outputs, dtype)
+
+        return cls(genomes, topology, num_inputs, num_outputs)
+
+    def __len__(self):
+        return len(self.genomes)
+
+    def select(self, indices):
+        """
+        Makes a population of some of this one's organisms
+        :param indices: The rows to keep. They can repeat
+        :return: The new population
+        """
+
+        return Population(self.genomes[indices], self.topology, self.num_inputs, self.num_outputs,
+                          self.fitness[indices], self.generations[indices], self.numbers[indices],
+                          self.parents[indices], self.ids[indices])
+
+    def add_children(self, genomes, fitness, generation, parents=None):
+        """
+        Adds a generation's children to the end of the population
+        :param genomes: A 2-dimensional array of the children's weights
+        :param fitness: The children's fitness
+        :param generation: The generation the children were born in. They are numbered from
+        0, or after the last organism of that generation already in the population
+        :param parents: A 2-dimensional array (children, 2) of rows of this population. None
+        if they have no parents here, like migrants from another island
+        """
+
+        size = len(genomes)
+        first_id = self.ids.max() + 1 if len(self) > 0 else 0
+        same_generation = self.numbers[self.generations == generation]
+        first_number = same_generation.max() + 1 if len(same_generation) > 0 else 0
+        parent_ids = np.full((size, 2), -1, dtype=np.int64) if parents is None else self.ids[parents]
+
+        self.genomes = np.concatenate((self.genomes, genomes))
+        self.fitness = np.concatenate((self.fitness, fitness))
+        self.generations = np.concatenate((self.generations, np.full(size, generation, dtype=np.int32)))
+        self.numbers = np.concatenate((self.numbers, np.arange(first_number, first_number + size, dtype=np.int32)))
+        self.parents = np.concatenate((self.parents, parent_ids))
+        self.ids = np.concatenate((self.ids, np.arange(first_id, first_id + size, dtype=np.int64)))
+
+    def names(self):
+        """
+        Gets the name of each organism. (generation)-(number).net
+        """
+
+        return [str(g) + "-" + str(n) + ".net" for (g, n) in zip(self.generations, self.numbers)]
+
+    def net(self, i):
+        """
+        Gets a net whose weights are organism i's genome. Changing the net changes the genome
+        """
+
+        return neuralnet.FFNN(self.topology, self.num_inputs, self.num_outputs, self.genomes[i])
+
+    def nets(self):
+        """
+        Gets a net for every organism, like net(i)
+        """
+
+        return [self.net(i) for i in range(0, len(self))]
+
+    def to_archive(self, filename):
+        """
+        Writes the whole population to one file. See neuralnet.to_archive
+        """
+
+        neuralnet.to_archive_genomes(filename, self.genomes, self.fitness, self.names(),
+                                     self.topology, self.num_inputs, self.num_outputs)
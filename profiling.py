@@ -0,0 +1,162 @@
+"""
+Times the phases of each generation of a trainer, and profiles a range of generations
+with cProfile. Each generation gets a row in the timing log: how many seconds each
+phase took, the whole generation, how many evaluations were done and how many per second.
+"""
+
+import contextlib
+import cProfile
+import os
+import time
+
+TIMING_FNAME = "timing.csv"
+PROFILE_FNAME = "profile.pstats"
+# the phases of the trainers' loops
+GA_PHASES = ('generate_brains', 'directories', 'select', 'repopulate', 'evaluation', 'archive', 'telemetry',
+             'checkpoint')
+PSO_PHASES = ('generate_brains', 'directories', 'move', 'evaluation', 'archive', 'telemetry', 'checkpoint')
+
+
+class Timer:
+    """ Adds up how long each phase of a generation takes """
+
+    def __init__(self, phases, filename=None, profile=None, profile_fname=PROFILE_FNAME, resume=None):
+        """
+        :param phases: The names of the phases
+        :param filename: The timing log. None to not write one
+        :param profile: The (first, last) generations to profile, or None to not profile
+        :param profile_fname: Where the profile is dumped, once the last generation is done
+        :param resume: When resuming, the last generation of the checkpoint. The timing log
+        is added to instead of started over, with the rows of any later generations cut off
+        """
+
+        self.phases = phases
+        self.times = dict.fromkeys(phases, 0.0)
+        self.stack = []
+        self.evaluations = 0
+        self.start = time.perf_counter()
+
+        self.profile = profile
+        self.profile_fname = profile_fname
+        self.profiler = None
+
+        self.log = None
+        if filename is not None:
+            append = resume is not None and os.path.exists(filename)
+            if append:
+                truncate_log(filename, resume)
+
+            self.log = open(filename, "a" if append else "w")
+            if not append:
+                header = ("generation",) + phases + ("total", "evaluations", "evaluations_per_sec")
+                self.log.write(",".join(header) + "\n")
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Times a phase. Phases can be inside each other, and the inner phase's time isn't
+        counted in the outer one's
+        """
+
+        self.stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            self.times[name] += elapsed
+            if self.stack:
+                self.times[self.stack[-1]] -= elapsed
+
+    def count(self, evaluations):
+        """
+        Counts evaluations towards this generation
+        """
+
+        self.evaluations += evaluations
+
+    def start_generation(self, generation):
+        """
+        Starts timing a generation, and profiling it if it's in the range
+        :param generation: The generation number, as in the generation directories' names.
+        0 for generating the first population
+        """
+
+        self.times = dict.fromkeys(self.phases, 0.0)
+        self.evaluations = 0
+        self.start = time.perf_counter()
+
+        if self.profile is not None and self.profile[0] <= generation <= self.profile[1]:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def end_generation(self, generation):
+        """
+        Writes a generation's row of the timing log. Once the last generation to profile is
+        done, the profile is dumped
+        :param generation: The generation number
+        """
+
+        total = time.perf_counter() - self.start
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            if generation >= self.profile[1]:
+                self.dump_profile()
+
+        if self.log is not None:
+            evaluation = self.times.get('evaluation', 0.0)
+            rate = self.evaluations / evaluation if evaluation > 0 else 0.0
+            row = [str(generation)] + ["%.6f" % self.times[x] for x in self.phases] + \
+                ["%.6f" % total, str(self.evaluations), "%.1f" % rate]
+            self.log.write(",".join(row) + "\n")
+            self.log.flush()
+
+    def dump_profile(self):
+        self.profiler.dump_stats(self.profile_fname)
+        print("Profile written to " + self.profile_fname)
+        self.profiler = None
+        self.profile = None
+
+    def close(self):
+        """
+        Dumps the profile if the run ended inside the range, and closes the timing log
+        """
+
+        if self.profiler is not None:
+            self.dump_profile()
+
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def truncate_log(filename, last):
+    """
+    Cuts the rows of generations after last off the end of a timing log, along with a
+    row that was only partly written
+    """
+
+    with open(filename, "r+") as log:
+        end = 0
+        for line in iter(log.readline, ''):
+            generation = line.split(",", 1)[0]
+            if not line.endswith("\n") or (generation.isdigit() and int(generation) > last):
+                break
+            end = log.tell()
+
+        log.truncate(end)
+
+
+def parse_range(val):
+    """
+    Parses a range of generations to profile
+    :param val: first:last, or a single generation
+    :return: (first, last)
+    """
+
+    first, _, last = val.partition(":")
+
+    return int(first), int(last if last != '' else first)
@@ -0,0 +1,101 @@
+"""
+A particle swarm is a dict of (particles, dimensions) matrices: the positions, the
+velocities and the personal best positions, along with vectors of the current and
+personal best fitness. So this file is just a collection of functions that move a
+whole swarm at once.
+"""
+
+import numpy as np
+
+
+def make_swarm(positions, names=None):
+    """
+    Makes a swarm that isn't moving yet, and hasn't been evaluated
+    :param positions: A 2-dimensional array (particles, dimensions)
+    :param names: The name of each particle
+    :return: The swarm
+    """
+
+    if names is None:
+        names = ["0-" + str(i) + ".net" for i in range(0, len(positions))]
+
+    return {
+        'names': names,
+        'positions': positions,
+        # start with zero velocity
+        'velocities': np.zeros(positions.shape, dtype=positions.dtype),
+        # best is now
+        'best_positions': positions.copy(),
+        'fitness': np.full(len(positions), np.nan),
+        'best_fitness': np.full(len(positions), np.nan)}
+
+
+def make_best(minimize=False):
+    """
+    Makes a global best that any particle beats
+    """
+
+    return {'fitness': np.inf if minimize else -np.inf}
+
+
+def move_particles(swarm, g_best, w, c1, c2):
+    """
+    Moves every particle of the swarm at once
+    :param swarm: The swarm
+    :param g_best: The globally best solution
+    :param w: The inertia
+    :param c1: How strongly particles are pulled to their personal best
+    :param c2: How strongly particles are pulled to the global best
+    """
+
+    positions = swarm['positions']
+    velocities = swarm['velocities']
+
+    # update velocity, with fresh random coefficients for every particle and dimension
+    # v(t + 1) = w * v(t) + c1 * r1 * (p(t) - x(t)) + c2 * r2 * (g(t) - x(t))
+    velocities *= w
+
+    pull = swarm['best_positions'] - positions
+    pull *= np.random.random(positions.shape)
+    pull *= c1
+    velocities += pull
+
+    pull = g_best['position'] - positions
+    pull *= np.random.random(positions.shape)
+    pull *= c2
+    velocities += pull
+
+    # update position
+    # x(t + 1) = x(t) + v(t + 1)
+    positions += velocities
+
+
+def update_bests(swarm, g_best, minimize=False):
+    """
+    Updates the personal bests of the particles, and the global best, from the
+    particles' current fitness
+    :param minimize: Lower fitness is better
+    """
+
+    fitness = swarm['fitness']
+    best_fitness = swarm['best_fitness']
+
+    # nan is a personal best that hasn't been set yet
+    if minimize:
+        improved = ~(fitness >= best_fitness)
+    else:
+        improved = ~(fitness <= best_fitness)
+
+    swarm['best_positions'][improved] = swarm['positions'][improved]
+    best_fitness[improved] = fitness[improved]
+
+    if minimize:
+        best = np.nanargmin(best_fitness)
+        better = best_fitness[best] < g_best['fitness']
+    else:
+        best = np.nanargmax(best_fitness)
+        better = best_fitness[best] > g_best['fitness']
+
+    if better:
+        g_best['position'] = swarm['best_positions'][best].copy()
+        g_best['fitness'] = best_fitness[best]
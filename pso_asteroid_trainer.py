@@ -2,32 +2,57 @@ import sys
 import getopt
 import neuralnet
 import os
-import nnrunner
+import episode_pool
+import fitness_cache
+import pso
+import telemetry
+import checkpoint
+import profiling
 import numpy as np
-import copy
 
 # constants
 NET_INPUTS = 5
 NET_OUTPUTS = 3
 INIT_DIR = "generationinit"
+ARCHIVE_FNAME = "population.arc"
 NUM_AVERAGE = 3
 
+# games are noisy, so this keeps the running mean score of each genome
+cache = fitness_cache.FitnessCache()
+# plays the games
+episodes = None
+# times each phase of a generation
+timer = profiling.Timer(profiling.PSO_PHASES)
+
 
 def main(argv):
 
     # How the program is to be used
     usage = "\tusage: --pop=[population size] --it=[number of iterations] --topology=[t1,t2] --inertia=[w]" \
-            " --c1=[c1] --c2=[c2]\n"
+            " --c1=[c1] --c2=[c2] --workers=[# of games at once] --timeout=[seconds per game]" \
+            " --telemetry=[csv|bin|both] --sample=[all|summary]" \
+            " --resume --checkpoint=[save every # iterations] --profile=[first:last generation to profile]" \
+            " --dtype=[" + "|".join(neuralnet.DTYPES) + "]\n"
 
-    optlist, args = getopt.getopt(argv[1:], "h", ["help", "pop=", "it=", "topology=", "inertia=", "c1=", "c2="])
+    optlist, args = getopt.getopt(argv[1:], "h", ["help", "pop=", "it=", "topology=", "inertia=", "c1=", "c2=",
+                                                  "workers=", "timeout=", "telemetry=", "sample=",
+                                                  "resume", "checkpoint=", "profile=", "dtype="])
 
     # default parameters
     population_size = 100
     num_iterations = 100
+    telemetry_format = "csv"
+    sample = "all"
+    resume = False
+    checkpoint_every = checkpoint.CHECKPOINT_EVERY
+    profile = None
     topology = []
     w = .7968
     c1 = 1.4962
     c2 = 1.4962
+    workers = 1
+    timeout = episode_pool.TIMEOUT
+    dtype = "float64"
 
     # replace the parameters
     for key, val in optlist:
@@ -38,124 +63,193 @@ def main(argv):
             population_size = int(val)
         elif key == "--it":
             num_iterations = int(val)
+        elif key == "--telemetry":
+            telemetry_format = val
+        elif key == "--sample":
+            sample = val
+        elif key == "--resume":
+            resume = True
+        elif key == "--checkpoint":
+            checkpoint_every = int(val)
+        elif key == "--profile":
+            profile = profiling.parse_range(val)
+        elif key == "--dtype":
+            dtype = val
         elif key == "--topology":
             entries = val.split(",")
             for entry in entries:
                 topology.append(int(entry))
         elif key == "--inertia":
             w = float(val)
-        elif key == "c1":
+        elif key == "--c1":
             c1 = float(val)
-        elif key == "c2":
+        elif key == "--c2":
             c2 = float(val)
+        elif key == "--workers":
+            workers = int(val)
+        elif key == "--timeout":
+            timeout = float(val)
+
+    if telemetry_format not in telemetry.FORMATS or sample not in telemetry.SAMPLES:
+        print("Unknown telemetry format or sample. Use -h or --help for help")
+        return
+
+    if dtype not in neuralnet.DTYPES:
+        print("Unknown dtype " + dtype + ". Use -h or --help for help")
+        return
 
     # can't run without a topology
     if not topology:
         print("Topology must be specified. Use -h or --help for help")
-
-    # init the global best
-    g_best = {'fitness': 0}
-
-    brains = generate_brains(population_size, topology, g_best)
-
-    # open the points file
-    points = open("points.csv", "w")
-    points.truncate()
-
-    for iteration in range(0, num_iterations):
-        print("Generation " + str(iteration + 1))
-
-        # make the directory if it doesn't exist
-        dirname = "generation" + str(iteration + 1)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
-
-        # the index file
-        index = open(dirname + "/index.csv", "w")
-
-        # update particles
-        update_particles(brains, g_best, w, c1, c2)
-
-        for organism in brains:
-            # write to file
-            organismfilename = dirname + "/" + organism['name']
-            neuralnet.to_file(organismfilename, organism['net'])
+        return
+
+    global episodes
+    episodes = episode_pool.EpisodePool(workers, timeout)
+
+    # carry on from the last checkpoint, or start from scratch
+    global cache
+    global timer
+    state = checkpoint.resume() if resume else None
+    timer = profiling.Timer(profiling.PSO_PHASES, profiling.TIMING_FNAME, profile,
+                            resume=None if state is None else state['iteration'] + 1)
+    if state is None:
+        # init the global best
+        g_best = pso.make_best()
+
+        timer.start_generation(0)
+        with timer.phase('generate_brains'):
+            swarm = generate_brains(population_size, topology, g_best, neuralnet.DTYPES[dtype])
+        timer.end_generation(0)
+        first_iteration = 0
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample)
+    else:
+        swarm = state['swarm']
+        g_best = state['g_best']
+        cache = state['cache']
+        first_iteration = state['iteration'] + 1
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample, sizes=state['points'])
+
+    # whatever has been recorded is written even if the run crashes
+    try:
+        for iteration in range(first_iteration, num_iterations):
+            print("Generation " + str(iteration + 1))
+            timer.start_generation(iteration + 1)
+
+            # make the directory if it doesn't exist
+            dirname = "generation" + str(iteration + 1)
+            with timer.phase('directories'):
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname)
+
+            # update particles
+            update_particles(swarm, g_best, w, c1, c2)
+
+            # write the whole generation to one file
+            with timer.phase('archive'):
+                write_archive(dirname, swarm)
 
             # write out to the index and the points
-            index.write(str(organism['fitness']) + "," + organismfilename.split('/')[-1] + "\n")
-            points.write(str(iteration) + "," + str(organism['fitness']) + "\n")
+            with timer.phase('telemetry'):
+                points.index(dirname + "/index.csv", swarm['fitness'], swarm['names'])
+                points.record(iteration, swarm['fitness'])
+
+            # save where the run is up to every so often
+            if (iteration + 1) % checkpoint_every == 0 or iteration == num_iterations - 1:
+                with timer.phase('checkpoint'):
+                    checkpoint.save(checkpoint.CHECKPOINT_FNAME, {'iteration': iteration, 'swarm': swarm,
+                                                                  'g_best': g_best, 'cache': cache,
+                                                                  'points': points.sizes()})
+
+            timer.end_generation(iteration + 1)
+    finally:
+        points.close()
+        timer.close()
+    episodes.close()
+
+    print("Fitness cache: " + str(cache.hits) + " hits, " + str(cache.misses) + " misses")
+
+
+def update_particles(swarm, g_best, w, c1, c2):
+    """
+    Moves every particle of the swarm at once, then evaluates each of them once
+    :param swarm: The swarm. Its positions, velocities and personal bests are
+    (particles, n_weights) matrices
+    :param g_best: The globally best solution
+    """
+
+    with timer.phase('move'):
+        pso.move_particles(swarm, g_best, w, c1, c2)
+
+    # evaluate and check against the personal bests and global best
+    swarm['fitness'] = np.array(get_fitness(swarm_nets(swarm)))
+    pso.update_bests(swarm, g_best)
+
+
+def generate_brains(population, topology, g_best, dtype=np.float64):
+    """
+    Generate a swarm of random nets that aren't moving yet
+    :param population: The number of particles to generate
+    :param topology: The topology of the nets
+    :param g_best: The globally best solution
+    :param dtype: The precision of the nets. np.float64 or np.float32
+    :return: The swarm
+    """
 
-        index.close()
-
-    points.close()
-
-
-def update_particles(population, g_best, w, c1, c2):
-
-    for organism in population:
-
-        for i in range(0, len(organism['net'].layers)):
-            for j in range(0, len(organism['net'].layers[i])):
-                for k in range(0, len(organism['net'].layers[i][j])):
+    # make a directory
+    if not os.path.exists(INIT_DIR):
+        os.makedirs(INIT_DIR)
 
-                    # update velocity
-                    # v(t + 1) = w * v(t) + c1 * (p(t) - x(t)) + c2 * (g(t) - x(t))
-                    organism['velocity'].layers[i][j][k] = w * organism['velocity'].layers[i][j][k] \
-                                    + c1 * (organism['best_net'].layers[i][j][k] - organism['net'].layers[i][j][k]) \
-                                    + c2 * (g_best['net'].layers[i][j][k] - organism['net'].layers[i][j][k])
+    # TODO may need to start with a wider range of weights
+    positions = np.stack([neuralnet.make_net(topology, NET_INPUTS, NET_OUTPUTS, dtype) for i in range(0, population)])
 
-                    # update position
-                    # x(t + 1) = x(t) + v(t + 1)
-                    organism['net'].layers[i][j][k] += organism['velocity'][i][j][k]
+    swarm = pso.make_swarm(positions)
+    swarm['topology'] = topology
 
-                    # evaluate and check against the global best and personal best
-                    neuralnet.to_file('temp.net', organism['net'])
-                    organism['fitness'] = get_fitness('temp.net')
+    # evaluate them all at once, and write them out
+    swarm['fitness'] = np.array(get_fitness(swarm_nets(swarm)))
 
-                    if organism['fitness'] > organism['best_fitness']:
-                        organism['best_net'] = copy.deepcopy(organism['net'])
-                        organism['best_fitness'] = organism['fitness']
+    # start the best with the best
+    pso.update_bests(swarm, g_best)
 
+    write_archive(INIT_DIR, swarm)
 
-def generate_brains(population, topology, g_best):
-    brains = []
+    return swarm
 
-    # make a directory
-    if not os.path.exists(INIT_DIR):
-        os.makedirs(INIT_DIR)
 
-    for i in range(0, population):
-        organism = {
-            # TODO may need to start with a wider range of weights
-            'net': neuralnet.FFNN(topology, NET_INPUTS, NET_OUTPUTS),
-            'name': "0-" + str(i) + ".net",
-            'velocity': neuralnet.FFNN(topology, NET_INPUTS, NET_OUTPUTS)}
+def swarm_nets(swarm):
+    """
+    Gets a net for each particle. The nets' weights are the particles' positions
+    """
 
-        # start with zero velocity
-        neuralnet.zero_out(organism['velocity'])
+    return [neuralnet.FFNN(swarm['topology'], NET_INPUTS, NET_OUTPUTS, x) for x in swarm['positions']]
 
-        # write it out and evaluate
-        neuralnet.to_file(INIT_DIR + "/" + organism['name'], organism['net'])
-        organism['fitness'] = get_fitness(INIT_DIR + "/" + organism['name'])
 
-        # best is now
-        organism['best_net'] = copy.deepcopy(organism['net'])
-        organism['best_fitness'] = organism['fitness']
+def get_fitness(nets):
+    """
+    Scores nets by their mean over NUM_AVERAGE games. Only the games the cache
+    doesn't already have are played, and they are all played at once
+    :param nets: A list of neural net objects
+    :return: A list of mean scores
+    """
 
-        # start the best with the best
-        if organism['fitness'] > g_best['fitness']:
-            g_best['net'] = copy.deepcopy(organism['net'])
+    needed = [max(0, NUM_AVERAGE - cache.samples(x.weights)) for x in nets]
+    with timer.phase('evaluation'):
+        scores = episodes.run(nets, needed)
+    timer.count(sum(needed))
 
-        brains.append(organism)
+    fits = []
+    for (net, count, net_scores) in zip(nets, needed, scores):
+        if count > 0:
+            fits.append(cache.add(net.weights, net_scores))
+        else:
+            fits.append(cache.get(net.weights))
 
-    return brains
+    return fits
 
 
-def get_fitness(fname):
-    scores = []
-    for i in range(0, NUM_AVERAGE):
-        scores.append(nnrunner.run(fname))
-    return np.mean(scores)
+def write_archive(dirname, swarm):
+    neuralnet.to_archive_genomes(dirname + "/" + ARCHIVE_FNAME, swarm['positions'], swarm['fitness'],
+                                 swarm['names'], swarm['topology'], NET_INPUTS, NET_OUTPUTS)
 
 
 # This is here to ensure main is only called when
@@ -0,0 +1,303 @@
+import sys
+import getopt
+import neuralnet
+import os
+import classifier_fitness as cf
+import pso
+import telemetry
+import checkpoint
+import profiling
+import numpy as np
+
+# constants
+NET_INPUTS = 4
+NET_OUTPUTS = 3
+INIT_DIR = "generationinit"
+ARCHIVE_FNAME = "population.arc"
+TEST_EVERY = 10
+DATASET_FNAME = "/home/justin/data/iris.csv"
+
+# globals because yeah
+dataset = DATASET_FNAME
+num_inputs = NET_INPUTS
+num_outputs = NET_OUTPUTS
+testing_set = ''
+training_set = ''
+testing_evaluator = None
+training_evaluator = None
+# times each phase of a generation
+timer = profiling.Timer(profiling.PSO_PHASES)
+
+
+def main(argv):
+
+    # How the program is to be used
+    usage = "\tusage: --pop=[population size] --it=[number of iterations] --inertia=[w] --c1=[c1] --c2=[c2]" \
+            " --topology=[layer1,layer2,etc] --ds=[dataset filename] --in[# of inputs] --out[# of outputs]" \
+            " --workers=[# of processes to evaluate with] --test=[test the global best every # iterations]" \
+            " --telemetry=[csv|bin|both] --sample=[all|summary]" \
+            " --resume --checkpoint=[save every # iterations] --profile=[first:last generation to profile]" \
+            " --batch=[# of rows to score on at first] --growth=[batch growth per iteration] --adaptive" \
+            " --dtype=[" + "|".join(neuralnet.DTYPES) + "]\n"
+
+    optlist, args = getopt.getopt(argv[1:], "h", ["help", "pop=", "it=", "inertia=", "c1=", "c2=",
+                                                  "topology=", "ds=", "in=", "out=", "workers=", "test=",
+                                                  "telemetry=", "sample=",
+                                                  "resume", "checkpoint=", "profile=",
+                                                  "batch=", "growth=", "adaptive", "dtype="])
+
+    # default parameters
+    population_size = 100
+    num_iterations = 100
+    telemetry_format = "csv"
+    sample = "all"
+    resume = False
+    checkpoint_every = checkpoint.CHECKPOINT_EVERY
+    profile = None
+    batch = 0
+    growth = cf.BATCH_GROWTH
+    adaptive = False
+    w = .7968
+    c1 = 1.4962
+    c2 = 1.4962
+    topology = []
+    workers = 1
+    test_every = TEST_EVERY
+    dtype = "float64"
+    global dataset
+    global num_inputs
+    global num_outputs
+
+    # replace the parameters
+    for key, val in optlist:
+        if key in ("-h", "--help"):
+            print(usage)
+            return
+        elif key == "--pop":
+            population_size = int(val)
+        elif key == "--it":
+            num_iterations = int(val)
+        elif key == "--telemetry":
+            telemetry_format = val
+        elif key == "--sample":
+            sample = val
+        elif key == "--resume":
+            resume = True
+        elif key == "--checkpoint":
+            checkpoint_every = int(val)
+        elif key == "--profile":
+            profile = profiling.parse_range(val)
+        elif key == "--dtype":
+            dtype = val
+        elif key == "--batch":
+            batch = int(val)
+        elif key == "--growth":
+            growth = float(val)
+        elif key == "--adaptive":
+            adaptive = True
+        elif key == "--inertia":
+            w = float(val)
+        elif key == "--c1":
+            c1 = float(val)
+        elif key == "--c2":
+            c2 = float(val)
+        elif key == "--topology":
+            entries = val.split(",")
+            for entry in entries:
+                topology.append(int(entry))
+        elif key == "--ds":
+            dataset = str(val)
+        elif key == "--in":
+            num_inputs = int(val)
+        elif key == "--out":
+            num_outputs = int(val)
+        elif key == "--workers":
+            workers = int(val)
+        elif key == "--test":
+            test_every = int(val)
+
+    if telemetry_format not in telemetry.FORMATS or sample not in telemetry.SAMPLES:
+        print("Unknown telemetry format or sample. Use -h or --help for help")
+        return
+
+    if dtype not in neuralnet.DTYPES:
+        print("Unknown dtype " + dtype + ". Use -h or --help for help")
+        return
+
+    if batch > 0 and workers > 1:
+        print("Mini-batches can't be scored by more than one worker. Use -h or --help for help")
+        return
+
+    # can't run without a topology
+    if not topology:
+        print("Topology must be specified. Use -h or --help for help")
+        return
+    if dataset == '':
+        print("Dataset must be specified. Use -h or --help for help")
+        return
+
+    # split up into testing and training sets
+    global testing_set
+    global training_set
+    training_set, testing_set = cf.make_te_tr_sets(dataset)
+
+    # parse the sets once, so whole swarms can be scored against them
+    global testing_evaluator
+    global training_evaluator
+    pool = None
+    if workers > 1:
+        # the workers get the sets through shared memory
+        pool = cf.EvaluationPool([cf.load_dataset(testing_set), cf.load_dataset(training_set)], workers)
+        testing_evaluator = pool.evaluator(0)
+        training_evaluator = pool.evaluator(1)
+    else:
+        testing_evaluator = cf.PopulationEvaluator(cf.load_dataset(testing_set))
+        training_evaluator = cf.PopulationEvaluator(cf.load_dataset(training_set))
+        if batch > 0:
+            # score on a growing subset of the training set instead of all of it
+            training_evaluator = cf.MiniBatchEvaluator(training_evaluator.ds, batch, growth, adaptive)
+
+    # carry on from the last checkpoint, or start from scratch
+    global timer
+    state = checkpoint.resume() if resume else None
+    timer = profiling.Timer(profiling.PSO_PHASES, profiling.TIMING_FNAME, profile,
+                            resume=None if state is None else state['iteration'] + 1)
+    if state is None:
+        # init the global best
+        g_best = pso.make_best()
+
+        timer.start_generation(0)
+        with timer.phase('generate_brains'):
+            swarm = generate_brains(population_size, topology, g_best, neuralnet.DTYPES[dtype])
+        timer.end_generation(0)
+        first_iteration = 0
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample)
+    else:
+        swarm = state['swarm']
+        g_best = state['g_best']
+        # the mini-batches carry on where they were, or start now if the run didn't use them
+        if batch > 0 and state['batch'] is not None:
+            training_evaluator.size, training_evaluator.samples = state['batch']
+        first_iteration = state['iteration'] + 1
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample, sizes=state['points'])
+
+    # whatever has been recorded is written even if the run crashes
+    try:
+        for iteration in range(first_iteration, num_iterations):
+            print("Generation " + str(iteration + 1))
+            timer.start_generation(iteration + 1)
+
+            # make the directory if it doesn't exist
+            dirname = "generation" + str(iteration + 1)
+            with timer.phase('directories'):
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname)
+
+            # update particles
+            update_particles(swarm, g_best, w, c1, c2)
+
+            # write the whole generation to one file
+            with timer.phase('archive'):
+                write_archive(dirname, swarm)
+
+            # the index file
+            with timer.phase('telemetry'):
+                points.index(dirname + "/index.csv", swarm['fitness'], swarm['names'])
+
+            # only the global best is tested, and only every so often
+            test_score = np.nan
+            if (iteration + 1) % test_every == 0 or iteration == num_iterations - 1:
+                test_score = get_fitness(testing_evaluator, g_best['position'][None], swarm['topology'])[0]
+
+            with timer.phase('telemetry'):
+                points.record(iteration, g_best['fitness'], test_score)
+
+            # save where the run is up to every so often
+            if (iteration + 1) % checkpoint_every == 0 or iteration == num_iterations - 1:
+                with timer.phase('checkpoint'):
+                    checkpoint.save(checkpoint.CHECKPOINT_FNAME, {'iteration': iteration, 'swarm': swarm,
+                                                                  'g_best': g_best, 'points': points.sizes(),
+                                                                  'batch': batch_state()})
+
+            timer.end_generation(iteration + 1)
+    finally:
+        points.close()
+        timer.close()
+
+    if pool is not None:
+        pool.close()
+
+
+def update_particles(swarm, g_best, w, c1, c2):
+    """
+    Moves every particle of the swarm at once, then evaluates the whole swarm at once
+    """
+
+    with timer.phase('move'):
+        pso.move_particles(swarm, g_best, w, c1, c2)
+
+    # with mini-batches, the bests are scored again on the new subset so they're compared fairly
+    if isinstance(training_evaluator, cf.MiniBatchEvaluator):
+        training_evaluator.resample(swarm['fitness'])
+        swarm['best_fitness'] = get_fitness(training_evaluator, swarm['best_positions'], swarm['topology'])
+        g_best['fitness'] = get_fitness(training_evaluator, g_best['position'][None], swarm['topology'])[0]
+
+    # evaluate and check against the personal bests and global best
+    swarm['fitness'] = get_fitness(training_evaluator, swarm['positions'], swarm['topology'])
+    pso.update_bests(swarm, g_best)
+
+
+def generate_brains(population, topology, g_best, dtype=np.float64):
+    """
+    Generate a swarm of random nets that aren't moving yet
+    :param population: The number of particles to generate
+    :param topology: The topology of the nets
+    :param g_best: The globally best solution
+    :param dtype: The precision of the nets. np.float64 or np.float32
+    :return: The swarm
+    """
+
+    # make a directory
+    if not os.path.exists(INIT_DIR):
+        os.makedirs(INIT_DIR)
+
+    positions = np.stack([neuralnet.make_net(topology, num_inputs, num_outputs, dtype) for i in range(0, population)])
+
+    swarm = pso.make_swarm(positions)
+    swarm['topology'] = topology
+
+    # evaluate them all at once
+    swarm['fitness'] = get_fitness(training_evaluator, swarm['positions'], topology)
+
+    # start the best with the best
+    pso.update_bests(swarm, g_best)
+
+    return swarm
+
+
+def get_fitness(evaluator, genomes, topology):
+    timer.count(len(genomes))
+    with timer.phase('evaluation'):
+        return evaluator.get_fitness_genomes(genomes, topology, num_inputs, num_outputs)
+
+
+def batch_state():
+    """
+    Gets what's needed to carry on with the same mini-batches when resuming
+    """
+
+    if isinstance(training_evaluator, cf.MiniBatchEvaluator):
+        return training_evaluator.size, training_evaluator.samples
+
+    return None
+
+
+def write_archive(dirname, swarm):
+    neuralnet.to_archive_genomes(dirname + "/" + ARCHIVE_FNAME, swarm['positions'], swarm['fitness'],
+                                 swarm['names'], swarm['topology'], num_inputs, num_outputs)
+
+
+# This is here to ensure main is only called when
+#   this file is run, not just loaded
+if __name__ == "__main__":
+    main(sys.argv)
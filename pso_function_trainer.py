@@ -1,30 +1,48 @@
 import sys
 import getopt
 import os
+import telemetry
+import checkpoint
+import profiling
 import numpy as np
-import copy
+import pso
+import benchmark_functions as bf
 
 # constants
 INIT_DIR = "generationinit"
 DIMENSIONS = 7
+FUNCTION = "sphere"
+
+# times each phase of a generation
+timer = profiling.Timer(profiling.PSO_PHASES)
 
 
 def main(argv):
 
     # How the program is to be used
     usage = "\tusage: --pop=[population size] --it=[number of iterations] --inertia=[w]" \
-            " --c1=[c1] --c2=[c2]\n"
+            " --c1=[c1] --c2=[c2] --function=[" + "|".join(bf.FUNCTIONS) + "] --dim=[dimensions]" \
+            " --telemetry=[csv|bin|both] --sample=[all|summary]" \
+            " --resume --checkpoint=[save every # iterations] --profile=[first:last generation to profile]\n"
 
     optlist, args = getopt.getopt(argv[1:], "h", ["help", "pop=", "it=", "inertia=",
-                                                  "c1=", "c2="])
+                                                  "c1=", "c2=", "function=", "dim=", "telemetry=", "sample=",
+                                                  "resume", "checkpoint=", "profile="])
 
     # default parameters
     population_size = 100
     num_iterations = 100
+    telemetry_format = "csv"
+    sample = "all"
+    resume = False
+    checkpoint_every = checkpoint.CHECKPOINT_EVERY
+    profile = None
     w = 1
     wdamp = .99
     c1 = 2
     c2 = 2
+    function = FUNCTION
+    dimensions = DIMENSIONS
 
     # replace the parameters
     for key, val in optlist:
@@ -35,117 +53,135 @@ def main(argv):
             population_size = int(val)
         elif key == "--it":
             num_iterations = int(val)
+        elif key == "--telemetry":
+            telemetry_format = val
+        elif key == "--sample":
+            sample = val
+        elif key == "--resume":
+            resume = True
+        elif key == "--checkpoint":
+            checkpoint_every = int(val)
+        elif key == "--profile":
+            profile = profiling.parse_range(val)
         elif key == "--inertia":
             w = float(val)
         elif key == "--c1":
             c1 = float(val)
         elif key == "--c2":
             c2 = float(val)
+        elif key == "--function":
+            function = val
+        elif key == "--dim":
+            dimensions = int(val)
+
+    if telemetry_format not in telemetry.FORMATS or sample not in telemetry.SAMPLES:
+        print("Unknown telemetry format or sample. Use -h or --help for help")
+        return
+
+    if function not in bf.FUNCTIONS:
+        print("Unknown function " + function + ". Use -h or --help for help")
+        return
+
+    # carry on from the last checkpoint, or start from scratch
+    global timer
+    state = checkpoint.resume() if resume else None
+    timer = profiling.Timer(profiling.PSO_PHASES, profiling.TIMING_FNAME, profile,
+                            resume=None if state is None else state['iteration'] + 1)
+    if state is None:
+        # init the global best
+        g_best = pso.make_best(minimize=True)
+
+        timer.start_generation(0)
+        with timer.phase('generate_brains'):
+            swarm = generate_brains(population_size, dimensions, function, g_best)
+        timer.end_generation(0)
+        first_iteration = 0
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample)
+    else:
+        swarm = state['swarm']
+        g_best = state['g_best']
+        # the inertia carries on damping from where it was
+        w = state['w']
+        first_iteration = state['iteration'] + 1
+        points = telemetry.Telemetry("points.csv", telemetry_format, sample, sizes=state['points'])
+
+    # whatever has been recorded is written even if the run crashes
+    try:
+        for iteration in range(first_iteration, num_iterations):
+            print("Generation " + str(iteration + 1))
+            timer.start_generation(iteration + 1)
+
+            # make the directory if it doesn't exist
+            dirname = "generation" + str(iteration + 1)
+            with timer.phase('directories'):
+                if not os.path.exists(dirname):
+                    os.makedirs(dirname)
+
+            # update particles
+            update_particles(swarm, g_best, w, c1, c2, function)
+
+            # the index file
+            with timer.phase('telemetry'):
+                points.index(dirname + "/index.csv", swarm['fitness'], swarm['names'])
+                points.record(iteration, g_best['fitness'])
+
+            w *= wdamp
+
+            # save where the run is up to every so often
+            if (iteration + 1) % checkpoint_every == 0 or iteration == num_iterations - 1:
+                with timer.phase('checkpoint'):
+                    checkpoint.save(checkpoint.CHECKPOINT_FNAME, {'iteration': iteration, 'swarm': swarm,
+                                                                  'g_best': g_best, 'w': w, 'points': points.sizes()})
+
+            timer.end_generation(iteration + 1)
+    finally:
+        points.close()
+        timer.close()
+
+
+def update_particles(swarm, g_best, w, c1, c2, function):
+    """
+    Moves every particle of the swarm at once, then evaluates the whole swarm at once
+    """
 
-    # init the global best
-    g_best = {'fitness': 999999999}
-
-    brains = generate_brains(population_size, g_best)
-
-    # open the points file
-    points = open("points.csv", "w")
-    points.truncate()
-
-    for iteration in range(0, num_iterations):
-        print("Generation " + str(iteration + 1))
-
-        # make the directory if it doesn't exist
-        dirname = "generation" + str(iteration + 1)
-        if not os.path.exists(dirname):
-            os.makedirs(dirname)
-
-        # the index file
-        index = open(dirname + "/index.csv", "w")
-
-        # update particles
-        update_particles(brains, g_best, w, c1, c2)
-
-        for organism in brains:
-            # write to file
-            organismfilename = dirname + "/" + organism['name']
-            #neuralnet.to_file(organismfilename, organism['net'])
-
-            # write out to the index and the points
-            index.write(str(organism['fitness']) + "," + organismfilename.split('/')[-1] + "\n")
-
-        index.close()
-
-        points.write(str(iteration) + "," + str(g_best['fitness']) + "\n")
-
-        w *= wdamp
-
-    points.close()
-
-
-def update_particles(population, g_best, w, c1, c2):
-
-    for organism in population:
-
-        organism['velocity'] = (organism['velocity'] * w) + \
-                               ((organism['best_net'] - organism['net']) * c1 * np.random.random()) + \
-                               ((g_best['net'] - organism['net']) * c2 * np.random.random())
-        organism['net'] = organism['net'] + organism['velocity']
-
-        # evaluate and check against the global best and personal best
-        organism['fitness'] = get_fitness(organism['net'])
-
-        # update the personal best
-        if organism['fitness'] < organism['best_fitness']:
-            #print("Updating personal best from " + str(organism['best_fitness']) + " to " + str(organism['fitness']))
-            organism['best_net'] = copy.deepcopy(organism['net'])
-            organism['best_fitness'] = organism['fitness']
+    with timer.phase('move'):
+        pso.move_particles(swarm, g_best, w, c1, c2)
 
-            # update the global best -- only check if new personal best
-            if organism['fitness'] < g_best['fitness']:
-                #print("Updating global best from " + str(g_best['fitness']) + " to " + str(organism['fitness']))
-                g_best['net'] = copy.deepcopy(organism['net'])
-                g_best['fitness'] = organism['fitness']
+    # evaluate and check against the personal bests and global best
+    swarm['fitness'] = get_fitness(swarm['positions'], function)
+    pso.update_bests(swarm, g_best, minimize=True)
 
 
-def generate_brains(population, g_best):
+def generate_brains(population, dimensions, function, g_best):
     """
-    Generate an array of random vectors. They are from (-100, 100)
-    :param population: The number of organisms to generate
+    Generate a swarm of random vectors, spread over the function's usual search space
+    :param population: The number of particles to generate
+    :param dimensions: The length of each vector
+    :param function: The name of the function to minimize
     :param g_best: The globally best solution
-    :return: The list of brains
+    :return: The swarm
     """
-    brains = []
 
     # make a directory
     if not os.path.exists(INIT_DIR):
         os.makedirs(INIT_DIR)
 
-    for i in range(0, population):
-        organism = {
-            'net': np.random.rand(DIMENSIONS) * 200,
-            'name': "0-" + str(i) + ".net",
-            'velocity': np.zeros(DIMENSIONS)}
-
-        # evaluate
-        organism['fitness'] = get_fitness(organism['net'])
-
-        # best is now
-        organism['best_net'] = copy.deepcopy(organism['net'])
-        organism['best_fitness'] = organism['fitness']
+    bound = bf.FUNCTIONS[function][1]
+    swarm = pso.make_swarm((np.random.random((population, dimensions)) * 2 - 1) * bound)
 
-        # start the best with the best
-        if organism['fitness'] < g_best['fitness']:
-            #print("Updating global best from " + str(g_best['fitness']) + " to " + str(organism['fitness']))
-            g_best['net'] = copy.deepcopy(organism['net'])
-            g_best['fitness'] = organism['fitness']
+    # evaluate
+    swarm['fitness'] = get_fitness(swarm['positions'], function)
 
-        brains.append(organism)
+    # start the best with the best
+    pso.update_bests(swarm, g_best, minimize=True)
 
-    return brains
+    return swarm
 
 
-def get_fitness(net):
-    return np.sum(net ** 2)
+def get_fitness(positions, function):
+    timer.count(len(positions))
+    with timer.phase('evaluation'):
+        return bf.FUNCTIONS[function][0](positions)
 
 
 # This is here to ensure main is only called when
@@ -0,0 +1,121 @@
+"""
+Selection operators. Each one takes a 1-dimensional array of fitness scores, where
+higher is better, and returns a 1-dimensional array of the indices that were picked.
+"""
+
+import numpy as np
+
+
+def roulette(fitness, count, replace=True):
+    """
+    Fitness proportionate selection. Each pick is made with a chance proportional
+    to fitness. If no fitness is above 0, everything has the same chance
+    :param fitness: The fitness scores. Negative scores count as 0
+    :param count: How many to pick
+    :param replace: Whether the same index can be picked more than once. If not, at
+    most len(fitness) are picked
+    :return: The picked indices
+    """
+
+    weights = proportions(fitness)
+
+    if not replace:
+        # weighted sampling without replacement: each index gets a random key that is
+        # larger the heavier it is, and the largest keys win
+        with np.errstate(divide='ignore'):
+            keys = np.log(np.random.random(len(weights))) / weights
+        count = min(count, len(keys))
+        return np.argpartition(-keys, count - 1)[:count] if count > 0 else np.zeros(0, dtype=int)
+
+    # a binary search of the running total for each spin
+    totals = np.cumsum(weights)
+    spins = np.random.random(count) * totals[-1]
+
+    return np.minimum(np.searchsorted(totals, spins, side='right'), len(weights) - 1)
+
+
+def sus(fitness, count):
+    """
+    Stochastic universal sampling. Like roulette, but with one spin of a wheel that
+    has count evenly spaced pointers, so the picks are spread out the way the fitness is
+    :return: The picked indices
+    """
+
+    weights = proportions(fitness)
+    totals = np.cumsum(weights)
+
+    step = totals[-1] / count
+    pointers = (np.random.random() + np.arange(count)) * step
+
+    return np.minimum(np.searchsorted(totals, pointers, side='right'), len(weights) - 1)
+
+
+def tournament(fitness, count, k=2):
+    """
+    k-tournament selection. Each pick is the fittest of k indices chosen at random
+    :return: The picked indices
+    """
+
+    fitness = np.asarray(fitness)
+    entrants = np.random.randint(0, len(fitness), size=(count, k))
+    winners = np.argmax(fitness[entrants], axis=1)
+
+    return entrants[np.arange(count), winners]
+
+
+def rank(fitness, count, pressure=1.5, replace=True):
+    """
+    Linear rank selection. Like roulette, but the chances depend on each score's
+    rank rather than its size
+    :param pressure: How much the best is favoured over the worst. 1 <= pressure <= 2
+    :return: The picked indices
+    """
+
+    size = len(fitness)
+    ranks = np.empty(size)
+    ranks[np.argsort(fitness, kind='stable')] = np.arange(size)
+
+    # the worst gets (2 - pressure) / size, the best gets pressure / size
+    weights = (2 - pressure) / size + 2 * ranks * (pressure - 1) / (size * max(1, size - 1))
+
+    return roulette(weights, count, replace)
+
+
+def truncation(fitness, count):
+    """
+    Truncation selection. Picks the count fittest indices. If there are fewer than
+    count, they are picked again, fittest first, until there are enough
+    :return: The picked indices, fittest first
+    """
+
+    fitness = np.asarray(fitness)
+    if count <= 0:
+        return np.zeros(0, dtype=int)
+
+    best = np.argpartition(-fitness, min(count, len(fitness)) - 1)[:count]
+    best = best[np.argsort(-fitness[best], kind='stable')]
+
+    return np.resize(best, count)
+
+
+def proportions(fitness):
+    """
+    Turns fitness scores into non-negative weights. If none of them are above 0, they all
+    get the same weight
+    """
+
+    weights = np.clip(np.asarray(fitness, dtype=float), 0, None)
+
+    if not np.any(weights > 0):
+        return np.ones(len(weights))
+
+    return weights
+
+
+# the operators that can pick parents, by name
+SCHEMES = {
+    'roulette': roulette,
+    'sus': sus,
+    'tournament': tournament,
+    'rank': rank,
+    'truncation': truncation}
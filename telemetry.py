@@ -0,0 +1,225 @@
+"""
+Writes the records the trainers keep about each generation (points.csv and the index
+files) on a background thread, so the evolution loop never waits on the disk.
+
+Points can be written as CSV, as a columnar binary file, or both. The binary file is a
+list of blocks, one per flush: an int64 row count, an int64 column count, the int64
+generation column, and then each float64 value column.
+"""
+
+import os
+import queue
+import threading
+import numpy as np
+
+# how many generations to hold before handing them to the writer thread
+FLUSH_EVERY = 10
+FORMATS = ('csv', 'bin', 'both')
+SAMPLES = ('all', 'summary')
+
+
+class Telemetry:
+    """ A sink for per-generation records, written on a background thread """
+
+    def __init__(self, filename="points.csv", fmt='csv', sample='all', flush_every=FLUSH_EVERY, sizes=None):
+        """
+        :param filename: The CSV file. The binary file is the same name with .bin instead of .csv
+        :param fmt: csv, bin or both
+        :param sample: all, to keep every row, or summary, to keep only the best, median
+        and worst row of each generation by the first column
+        :param flush_every: How many generations to hold before writing them
+        :param sizes: The sizes the files had at a checkpoint, from sizes(). If given, the
+        files are cut back to them and added to, instead of being started empty
+        """
+
+        if fmt not in FORMATS:
+            raise ValueError('Unknown telemetry format ' + fmt)
+        if sample not in SAMPLES:
+            raise ValueError('Unknown telemetry sample ' + sample)
+
+        self.csv_fname = filename if fmt in ('csv', 'both') else None
+        self.bin_fname = None
+        if fmt in ('bin', 'both'):
+            self.bin_fname = (filename[:-4] if filename.endswith('.csv') else filename) + '.bin'
+
+        self.sample = sample
+        self.flush_every = flush_every
+        self.pending = []
+
+        # start the files empty, or from where the checkpoint left them
+        for fname in (self.csv_fname, self.bin_fname):
+            if fname is None:
+                continue
+            if sizes is not None and fname in sizes and os.path.exists(fname):
+                os.truncate(fname, sizes[fname])
+            else:
+                open(fname, "w").close()
+
+        # the first write that failed on the writer thread, to be raised by sync or close
+        self.error = None
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record(self, generation, *columns):
+        """
+        Records one generation
+        :param generation: The generation number
+        :param columns: 1-dimensional arrays of numbers, all the same length, or single
+        numbers. nan is written as an empty CSV field
+        """
+
+        columns = [np.atleast_1d(np.asarray(x, dtype=float)) for x in columns]
+        columns = [x[sample_rows(columns[0], self.sample)] for x in columns]
+
+        self.pending.append((generation, columns))
+
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def index(self, filename, fitness, names):
+        """
+        Writes a generation's index file. (fitness, name) per line
+        """
+
+        self.queue.put(('index', filename, (np.array(fitness, dtype=float), list(names))))
+
+    def flush(self):
+        """
+        Hands the generations that have been recorded to the writer thread
+        """
+
+        if self.pending:
+            self.queue.put(('points', None, self.pending))
+            self.pending = []
+
+    def sync(self):
+        """
+        Writes everything that has been recorded, and waits for it to be written. If a
+        write failed, its exception is raised here
+        """
+
+        self.flush()
+        self.queue.join()
+        self.raise_error()
+
+    def sizes(self):
+        """
+        Writes everything that has been recorded, then gets the size of each file
+        :return: A dict of filename: size, to resume from
+        """
+
+        self.sync()
+
+        return {fname: os.path.getsize(fname) for fname in (self.csv_fname, self.bin_fname) if fname is not None}
+
+    def close(self):
+        """
+        Writes everything that's left and stops the writer thread. If a write failed, its
+        exception is raised here
+        """
+
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def run(self):
+        """
+        The writer thread
+        """
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+
+            # a failed write is kept for sync() or close() to raise, and the thread carries
+            # on with the rest, so nothing waiting on the queue is stuck
+            try:
+                kind, filename, data = item
+                if kind == 'index':
+                    write_index(filename, *data)
+                else:
+                    self.write_points(data)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    def write_points(self, generations):
+        numbers = np.concatenate([np.full(len(columns[0]), generation) for (generation, columns) in generations])
+        values = [np.concatenate(x) for x in zip(*[columns for (generation, columns) in generations])]
+
+        if self.csv_fname is not None:
+            with open(self.csv_fname, "a") as points:
+                points.write(csv_rows(numbers, values))
+
+        if self.bin_fname is not None:
+            header = np.array([len(numbers), len(values)], dtype='<i8')
+            with open(self.bin_fname, "ab") as points:
+                for array in [header, numbers.astype('<i8')] + [x.astype('<f8') for x in values]:
+                    array.tofile(points)
+
+
+def sample_rows(fitness, sample):
+    """
+    Picks the rows of a generation to keep
+    :return: The row indices. For summary, the best, median and worst rows by fitness
+    """
+
+    if sample == 'all' or len(fitness) <= 3:
+        return np.arange(len(fitness))
+
+    order = np.argsort(fitness, kind='stable')
+
+    return order[[-1, len(order) // 2, 0]]
+
+
+def csv_rows(numbers, values):
+    """
+    Formats rows of points as CSV
+    """
+
+    rows = zip(numbers.tolist(), *[x.tolist() for x in values])
+
+    return "".join(",".join([str(row[0])] + ['' if x != x else str(x) for x in row[1:]]) + "\n" for row in rows)
+
+
+def write_index(filename, fitness, names):
+    with open(filename, "w") as index:
+        index.write("".join(str(x) + "," + name + "\n" for (x, name) in zip(fitness.tolist(), names)))
+
+
+def read_points(filename):
+    """
+    Reads a columnar binary points file
+    :return: The generation column and a list of the value columns
+    """
+
+    numbers = []
+    values = []
+
+    with open(filename, "rb") as points:
+        while True:
+            header = np.fromfile(points, dtype='<i8', count=2)
+            if len(header) < 2:
+                break
+
+            rows, cols = header
+            numbers.append(np.fromfile(points, dtype='<i8', count=rows))
+            values.append([np.fromfile(points, dtype='<f8', count=rows) for i in range(0, cols)])
+
+    if not numbers:
+        return np.zeros(0, dtype=np.int64), []
+
+    return np.concatenate(numbers), [np.concatenate(x) for x in zip(*values)]